@@ -138,5 +138,71 @@ AUTH_USER_MODEL ='core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson based, fall back to the stdlib json ones without orjson
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Set STOCK_API_DECIMALS_AS_NUMBERS=1 to render decimals as JSON numbers
+    'COERCE_DECIMAL_TO_STRING': os.environ.get('STOCK_API_DECIMALS_AS_NUMBERS', '0') != '1',
 }
 
+
+# Cursor pagination of the stock API, see stock/pagination.py
+STOCK_API_PAGE_SIZE = int(os.environ.get('STOCK_API_PAGE_SIZE', 100))
+STOCK_API_MAX_PAGE_SIZE = int(os.environ.get('STOCK_API_MAX_PAGE_SIZE', 1000))
+
+# Maximum number of stock runs per request to the bulk endpoint
+STOCK_API_MAX_BULK_SIZE = int(os.environ.get('STOCK_API_MAX_BULK_SIZE', 1000))
+
+# Users whose ticker search index is kept in memory, per process
+STOCK_API_TICKER_INDEX_USERS = int(os.environ.get('STOCK_API_TICKER_INDEX_USERS', 1000))
+
+# Render list endpoints of the stock API from .values() rows
+STOCK_API_FAST_LIST = os.environ.get('STOCK_API_FAST_LIST', '1') == '1'
+
+# Response cache of the stock API, keyed by user, URL and data version so
+# writes invalidate it, and the token -> user lookups of
+# core.authentication.CachedTokenAuthentication. Responses are kept in local
+# memory (LRU, bounded by MAX_ENTRIES) unless STOCK_API_CACHE_URL points at a
+# Redis shared by all workers, which should run with maxmemory-policy
+# allkeys-lru. Token lookups are only cached in that shared Redis: a deleted
+# token or deactivated user must be forgotten by every worker, not just the
+# one which handled the change.
+STOCK_API_CACHE = 'stock_api'
+STOCK_API_CACHE_TIMEOUT = int(os.environ.get('STOCK_API_CACHE_TIMEOUT', 300))
+# Largest pickled response cached, local memory holds at most
+# MAX_ENTRIES times this much per worker
+STOCK_API_CACHE_MAX_ITEM_BYTES = int(os.environ.get('STOCK_API_CACHE_MAX_ITEM_BYTES', 128 * 1024))
+AUTH_TOKEN_CACHE = 'auth_tokens'
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    STOCK_API_CACHE: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stock-api',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('STOCK_API_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+    AUTH_TOKEN_CACHE: {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        'TIMEOUT': AUTH_TOKEN_CACHE_TIMEOUT,
+    },
+}
+if os.environ.get('STOCK_API_CACHE_URL'):
+    for alias in [STOCK_API_CACHE, AUTH_TOKEN_CACHE]:
+        CACHES[alias] = {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('STOCK_API_CACHE_URL'),
+            'TIMEOUT': CACHES[alias].get('TIMEOUT', 300),
+            'KEY_PREFIX': alias,
+        }
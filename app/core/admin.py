@@ -41,3 +41,5 @@ class UserAdmin(BaseUserAdmin):
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Stock)
 admin.site.register(models.StockBase)
+admin.site.register(models.ImportCheckpoint)
+admin.site.register(models.DataVersion)
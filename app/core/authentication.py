@@ -0,0 +1,59 @@
+'''
+Token authentication with cached token lookups.
+'''
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def token_cache_key(key):
+    """Cache key of a token, the token itself is not stored in the key."""
+    return 'auth-token:{}'.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def forget_token(key):
+    caches[settings.AUTH_TOKEN_CACHE].delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication keeping token -> user lookups in a TTL cache.
+
+    Entries live for AUTH_TOKEN_CACHE_TIMEOUT seconds at most and are
+    dropped as soon as the token is deleted or its user is saved, e.g.
+    deactivated or given a new password. Writes which bypass signals, like
+    QuerySet.update(), are picked up once the entry expires.
+
+    The cache must be shared by all workers for the signals to reach every
+    entry, AUTH_TOKEN_CACHE is a no-op cache unless STOCK_API_CACHE_URL
+    points at Redis.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = caches[settings.AUTH_TOKEN_CACHE]
+        cache_key = token_cache_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials,
+                      settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return credentials
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_tokens_of_saved_user(sender, instance, created, **kwargs):
+    if not created:
+        tokens = Token.objects.filter(user=instance)
+        for key in tokens.values_list('key', flat=True):
+            forget_token(key)
@@ -0,0 +1,356 @@
+'''
+Shared helpers for the bulk stock data import commands.
+'''
+import datetime
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.models import Q
+
+from core.models import ImportCheckpoint, Stock, split_ticker
+from core.worker import init_worker
+
+
+BATCH_SIZE = 5000
+
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.feather', '.arrow', '.ipc')
+
+
+def file_fingerprint(file_path, block_size=1 << 20):
+    """sha256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def has_pending_checkpoint(name, fingerprint):
+    """Whether an import of this file under ``name`` was interrupted."""
+    return ImportCheckpoint.objects.filter(
+        name__startswith=name, fingerprint=fingerprint, completed=False,
+    ).exists()
+
+
+def get_checkpoint(name, fingerprint, resume=False):
+    """Fetch the checkpoint of an import, starting over unless resuming.
+
+    Args:
+        name (str): import name, one per command or shard
+        fingerprint (str): fingerprint of the imported file
+        resume (bool): keep the committed offset of an earlier attempt
+
+    Returns:
+        ImportCheckpoint: checkpoint to advance after every committed batch
+    """
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(
+        name=name, fingerprint=fingerprint)
+    if not created and not resume:
+        checkpoint.offset = 0
+        checkpoint.completed = False
+        checkpoint.save()
+    return checkpoint
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise CommandError(
+            'pyarrow is required to read Parquet and Arrow files.')
+    return pyarrow
+
+
+def _typed_frame(table, dtypes):
+    """Convert an Arrow table to pandas, casting only what is not typed yet."""
+    df = table.to_pandas(date_as_object=False)
+    casts = {
+        col: dtype for col, dtype in (dtypes or {}).items()
+        if col in df and dtype != 'object' and str(df[col].dtype) != dtype
+    }
+    return df.astype(casts) if casts else df
+
+
+def read_frames(file_path, columns, dtypes=None, chunk_size=None):
+    """Read a CSV, Parquet or Arrow IPC / Feather file into DataFrames.
+
+    The reader is picked from the file extension. Only ``columns`` are
+    read and columnar files are memory mapped, their typed columns are
+    kept as they are.
+
+    Args:
+        file_path (str): file to read
+        columns (list): columns to read
+        dtypes (dict): dtypes to apply, mostly needed for CSV
+        chunk_size (int): rows per frame, None reads the whole file at once
+
+    Yields:
+        DataFrame: the file, or chunks of it
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in CSV_EXTENSIONS:
+        if chunk_size is None:
+            yield pd.read_csv(file_path, usecols=columns, dtype=dtypes)
+            return
+        with pd.read_csv(file_path, usecols=columns, dtype=dtypes,
+                         chunksize=chunk_size) as reader:
+            yield from reader
+    elif extension in PARQUET_EXTENSIONS:
+        pa = _import_pyarrow()
+        categories = [col for col, dtype in (dtypes or {}).items()
+                      if dtype == 'category']
+        parquet_file = pa.parquet.ParquetFile(
+            file_path, memory_map=True, read_dictionary=categories)
+        if chunk_size is None:
+            yield _typed_frame(parquet_file.read(columns=columns), dtypes)
+            return
+        batches = parquet_file.iter_batches(
+            batch_size=chunk_size, columns=columns)
+        for batch in batches:
+            yield _typed_frame(pa.Table.from_batches([batch]), dtypes)
+    elif extension in ARROW_EXTENSIONS:
+        pa = _import_pyarrow()
+        table = pa.feather.read_table(
+            file_path, columns=columns, memory_map=True)
+        step = chunk_size or max(table.num_rows, 1)
+        for offset in range(0, max(table.num_rows, 1), step):
+            yield _typed_frame(table.slice(offset, step), dtypes)
+    else:
+        raise CommandError('Unsupported input file type: {}'.format(
+            extension or file_path))
+
+
+def frame_to_records(df):
+    """Convert a DataFrame into a list of dicts with plain python values.
+
+    NaN / NaT become None and numpy scalars become python scalars so the
+    rows can be handed straight to the ORM.
+
+    Args:
+        df (DataFrame): frame to convert
+
+    Returns:
+        list: one dict per row
+    """
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def batched(records, batch_size=BATCH_SIZE):
+    """Yield (offset, batch) slices of a list of records."""
+    for offset in range(0, len(records), batch_size):
+        yield offset, records[offset:offset + batch_size]
+
+
+def shard_frame(df, shards, column='ticker'):
+    """Split a frame by a stable hash of its (upper cased) ticker.
+
+    All rows of a ticker land in the same shard, so shards never write the
+    same natural key.
+
+    Args:
+        df (DataFrame): frame to split
+        shards (int): number of shards
+        column (str): ticker column
+
+    Returns:
+        list: non-empty frames
+    """
+    tickers = df[column].astype(str).str.upper().to_numpy(dtype=object)
+    keys = pd.util.hash_array(tickers) % shards
+    frames = [df[keys == shard] for shard in range(shards)]
+    return [frame for frame in frames if not frame.empty]
+
+
+def process_pool(workers):
+    """Process pool for sharded loads.
+
+    Workers are spawned rather than forked so that none of them inherits
+    the parent's database connection, each one opens its own on first use.
+    """
+    database_names = {
+        conn.alias: conn.settings_dict['NAME'] for conn in connections.all()
+    }
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker,
+                               initargs=(database_names,))
+
+
+def resolve_stock_ids(user, tickers):
+    """Map upper cased tickers to the user's Stock ids with a single query.
+
+    Runs are matched on their (symbol, run number), which the
+    stock_user_symbol_run_idx index covers.
+
+    Args:
+        user (User): owner of the stock runs
+        tickers (iterable): tickers to resolve, any case
+
+    Returns:
+        dict: {TICKER: stock id}, the lowest id wins for duplicated tickers
+    """
+    keys = {str(ticker).upper(): split_ticker(ticker) for ticker in tickers}
+    rows = stock_ids_queryset(user, keys.values())
+    ids = dict(((symbol, run_number), stock_id)
+               for symbol, run_number, stock_id in rows)
+    return {ticker: ids[key] for ticker, key in keys.items() if key in ids}
+
+
+def stock_ids_queryset(user, keys):
+    """(symbol, run number, id) rows of a user's runs, highest id first.
+
+    Args:
+        user (User): owner of the stock runs
+        keys (iterable): (symbol, run number) pairs
+
+    Returns:
+        QuerySet: candidate rows, a superset of the wanted keys
+    """
+    keys = set(keys)
+    symbols = {symbol for symbol, _ in keys}
+    run_numbers = {
+        run_number for _, run_number in keys if run_number is not None
+    }
+    runs = Q(run_number__in=run_numbers)
+    if any(run_number is None for _, run_number in keys):
+        runs |= Q(run_number__isnull=True)
+    return (Stock.objects
+            .filter(runs, user=user, symbol__in=symbols)
+            .order_by('-id')
+            .values_list('symbol', 'run_number', 'id'))
+
+
+def _canonical(value):
+    """String form of a value which is stable across input types."""
+    if value is None:
+        return ''
+    is_number = isinstance(value, (int, float, Decimal))
+    if is_number and not isinstance(value, bool):
+        return str(Decimal(str(value)).normalize())
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def row_hash(record, columns):
+    """Fingerprint the source values of a row.
+
+    Args:
+        record (dict): row values
+        columns (list): columns which make up the fingerprint
+
+    Returns:
+        str: 32 character hex digest
+    """
+    payload = '\x1f'.join(_canonical(record[col]) for col in columns)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def insert_new(model, records, batch_size=BATCH_SIZE):
+    """INSERT ... ON CONFLICT DO NOTHING rows, counting the ones written.
+
+    Rows conflicting with any unique constraint, such as the ones written
+    by an interrupted attempt, are skipped.
+
+    Args:
+        model (Model): model to write
+        records (list): dicts of field name to value
+        batch_size (int): rows per statement
+
+    Returns:
+        int: rows inserted
+    """
+    if not records:
+        return 0
+
+    names = list(records[0])
+    fields = [model._meta.get_field(name) for name in names]
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES %s '
+        'ON CONFLICT DO NOTHING RETURNING 1'
+    ).format(
+        table=model._meta.db_table,
+        columns=', '.join(field.column for field in fields),
+    )
+
+    inserted = 0
+    # the Django cursor, so the inserts show in query logs and execute wrappers
+    with connection.cursor() as cursor:
+        for _, batch in batched(records, batch_size):
+            rows = [
+                [field.get_db_prep_save(record[name], connection)
+                 for name, field in zip(names, fields)]
+                for record in batch
+            ]
+            inserted += len(execute_values(cursor, sql, rows,
+                                           page_size=batch_size, fetch=True))
+    return inserted
+
+
+def upsert(model, records, conflict_fields, update_fields,
+           batch_size=BATCH_SIZE):
+    """INSERT ... ON CONFLICT DO UPDATE rows keyed on their source_hash.
+
+    Rows are matched against the partial unique constraint on
+    ``conflict_fields`` and only rewritten when their source_hash changed.
+
+    Args:
+        model (Model): model to write
+        records (list): dicts of field name to value, including source_hash
+        conflict_fields (list): natural key of the model
+        update_fields (list): fields rewritten when a row changed
+        batch_size (int): rows per statement
+
+    Returns:
+        tuple: (rows inserted, rows updated, rows unchanged)
+    """
+    if not records:
+        return 0, 0, 0
+
+    names = list(records[0])
+    fields = [model._meta.get_field(name) for name in names]
+    table = model._meta.db_table
+    sql = (
+        'INSERT INTO {table} ({columns}) VALUES %s '
+        "ON CONFLICT ({keys}) WHERE source_hash <> '' DO UPDATE SET {updates} "
+        'WHERE {table}.source_hash IS DISTINCT FROM EXCLUDED.source_hash '
+        'RETURNING (xmax = 0)'
+    ).format(
+        table=table,
+        columns=', '.join(field.column for field in fields),
+        keys=', '.join(
+            model._meta.get_field(name).column for name in conflict_fields
+        ),
+        updates=', '.join(
+            '{0} = EXCLUDED.{0}'.format(model._meta.get_field(name).column)
+            for name in update_fields + ['source_hash']
+        ),
+    )
+
+    inserted = updated = 0
+    with connection.cursor() as cursor:
+        for _, batch in batched(records, batch_size):
+            rows = [
+                [field.get_db_prep_save(record[name], connection)
+                 for name, field in zip(names, fields)]
+                for record in batch
+            ]
+            written = execute_values(cursor, sql, rows,
+                                     page_size=batch_size, fetch=True)
+            for (was_inserted,) in written:
+                if was_inserted:
+                    inserted += 1
+                else:
+                    updated += 1
+    return inserted, updated, len(records) - inserted - updated
@@ -0,0 +1,271 @@
+'''
+Benchmark the stock data import commands against a scratch database.
+
+Generates synthetic stock_summary.csv / stock_base_data.csv files, loads
+them with the populate commands and reports throughput per phase as JSON.
+'''
+import datetime
+import io
+import json
+import os
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import ingest
+from core.management.commands import (
+    populate_stock_base_data_in_db,
+    populate_stock_run_data_in_db,
+)
+
+SECTORS = [
+    'Electronic Technology', 'Technology Services', 'Health Technology',
+    'Energy Minerals', 'Finance', 'Retail Trade', 'Consumer Services',
+    'Producer Manufacturing',
+]
+
+PHASES = ['parse', 'transform', 'write']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class QueryCounter:
+    """Execute wrapper counting queries without keeping their SQL."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """Measure import throughput of the populate commands.
+
+    Args:
+        BaseCommand (Command): Inherit from BaseCommand object
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10000,
+                            help='Number of synthetic stock runs to generate.')
+        parser.add_argument('--bases-per-run', type=int, default=6,
+                            help='Number of synthetic stock bases per run.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=populate_stock_run_data_in_db.CHUNK_SIZE,
+                            help='Chunk size used to stream the stock runs.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed of the synthetic data.')
+        parser.add_argument('--output',
+                            help='Write the JSON report to this file '
+                                 'instead of stdout.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as data_dir:
+            self.generate_data(data_dir, options['runs'],
+                               options['bases_per_run'], options['seed'])
+            with self.scratch_database():
+                user = get_user_model().objects.create_user(
+                    'benchmark@example.com', 'benchmark')
+                report = self.run_benchmark(
+                    data_dir, user, options['chunk_size'])
+
+        report.update({
+            'created': datetime.datetime.utcnow().isoformat(),
+            'runs': options['runs'],
+            'bases_per_run': options['bases_per_run'],
+            'chunk_size': options['chunk_size'],
+        })
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stdout.write(self.style.SUCCESS(
+                'Benchmark report written to {}'.format(options['output'])))
+        else:
+            self.stdout.write(output)
+
+    @contextmanager
+    def scratch_database(self):
+        """Point the default connection at a throwaway copy of the schema."""
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        test_settings['NAME'] = 'benchmark_ingest_{}'.format(
+            connection.settings_dict['NAME'])
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+
+    def generate_data(self, data_dir, runs, bases_per_run, seed=0):
+        """Write synthetic stock_summary.csv and stock_base_data.csv files.
+
+        About one percent of the runs are unfinished ('tbd' end date).
+        """
+        rng = np.random.default_rng(seed)
+        ids = np.arange(runs)
+        tickers = pd.Series(
+            ['T{:06d}-{}'.format(i // 4, i % 4 + 1) for i in ids])
+        start = pd.Timestamp('2000-01-03') + pd.to_timedelta(
+            rng.integers(0, 8000, runs), unit='D')
+        length = rng.integers(20, 400, runs)
+        end = start + pd.to_timedelta(length * 7 // 5, unit='D')
+        end = end.strftime('%m/%d/%Y').to_numpy(dtype=object)
+        end[rng.random(runs) < 0.01] = 'tbd'
+
+        pd.DataFrame({
+            'ticker': tickers,
+            'start_date': start.strftime('%m/%d/%Y'),
+            'end_date': end,
+            'sector': rng.choice(SECTORS, runs),
+            'num_bases': bases_per_run,
+            'length_run': length,
+            'pct_gain': rng.uniform(50, 5000, runs).round(1),
+        }).to_csv(os.path.join(data_dir, 'stock_summary.csv'), index=False)
+
+        rows = runs * bases_per_run
+        base_runs = np.repeat(ids, bases_per_run)
+        vol_bo = rng.integers(10 ** 5, 10 ** 8, rows)
+        vol_20 = rng.integers(10 ** 5, 10 ** 8, rows)
+        bo_date = start[base_runs] + pd.to_timedelta(
+            rng.integers(0, 400, rows), unit='D')
+        pd.DataFrame({
+            'ticker': tickers.to_numpy()[base_runs],
+            'base_count': np.tile(np.arange(1, bases_per_run + 1), runs),
+            'base_failure': rng.choice(['n', 'y', ''], rows),
+            'bo_date': bo_date.strftime('%m/%d/%Y'),
+            'vol_bo': vol_bo,
+            'vol_20': vol_20,
+            'bo_vol_ratio': (vol_bo / vol_20).clip(0, 99).round(2),
+            'price_percent_range': rng.uniform(5, 60, rows).round(2),
+            'base_length': rng.integers(3, 60, rows),
+            'sales_0qtr': rng.uniform(1, 10 ** 5, rows).round(2),
+        }).to_csv(os.path.join(data_dir, 'stock_base_data.csv'), index=False)
+
+    @contextmanager
+    def phase(self, phases, name):
+        """Accumulate wall time and queries of a phase."""
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            yield
+        stats = phases.setdefault(name, {'seconds': 0.0, 'queries': 0})
+        stats['seconds'] += time.perf_counter() - start
+        stats['queries'] += counter.count
+        stats['peak_rss_mb'] = round(peak_rss_mb(), 1)
+
+    def summarize(self, phases, rows):
+        """Add rows/sec to every phase and a total."""
+        total = {
+            'seconds': sum(phases[name]['seconds'] for name in PHASES),
+            'queries': sum(phases[name]['queries'] for name in PHASES),
+            'peak_rss_mb': max(phases[name]['peak_rss_mb'] for name in PHASES),
+        }
+        phases['total'] = total
+        for stats in phases.values():
+            stats['rows'] = rows
+            stats['rows_per_sec'] = (
+                round(rows / stats['seconds'], 1) if stats['seconds'] else None
+            )
+            stats['seconds'] = round(stats['seconds'], 4)
+        return phases
+
+    def timed(self, phases, name, func):
+        """Wrap a loader step so its calls are accumulated under a phase."""
+        def wrapper(*args, **kwargs):
+            with self.phase(phases, name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def timed_frames(self, phases, frames):
+        """Yield the frames of a reader, timing every read as parse."""
+        while True:
+            with self.phase(phases, 'parse'):
+                df = next(frames, None)
+            if df is None:
+                return
+            yield df
+
+    @contextmanager
+    def write_phase(self, phases):
+        """Time a whole load, what parse and transform do not cover is write.
+
+        The loaders read and prepare their frames batch by batch inside
+        their transactions, the write phase is the rest of the load.
+        """
+        steps = ['parse', 'transform']
+        before = {
+            name: dict(phases.get(name, {'seconds': 0.0, 'queries': 0}))
+            for name in steps
+        }
+        with self.phase(phases, 'load'):
+            yield
+        load = phases.pop('load')
+        write = phases.setdefault('write', {'seconds': 0.0, 'queries': 0})
+        for key in ['seconds', 'queries']:
+            steps_total = sum(
+                phases.get(name, before[name])[key] - before[name][key]
+                for name in steps
+            )
+            write[key] += load[key] - steps_total
+        write['peak_rss_mb'] = load['peak_rss_mb']
+
+    def run_benchmark(self, data_dir, user,
+                      chunk_size=populate_stock_run_data_in_db.CHUNK_SIZE):
+        """Load the synthetic files with the populate commands' loaders.
+
+        The runs go through load_stock_runs and the bases through
+        load_stock_bases, with their per batch transactions and
+        checkpoints, as the commands load them.
+
+        Returns:
+            dict: per loader and phase timings, queries, peak RSS and rows/sec
+        """
+        runs = populate_stock_run_data_in_db.Command(stdout=io.StringIO())
+        run_phases = {}
+        runs.prepare_stock_runs = self.timed(
+            run_phases, 'transform', runs.prepare_stock_runs)
+        with self.phase(run_phases, 'parse'):
+            fingerprint = ingest.file_fingerprint(
+                os.path.join(data_dir, 'stock_summary.csv'))
+            checkpoint = ingest.get_checkpoint(
+                populate_stock_run_data_in_db.CHECKPOINT_NAME, fingerprint)
+        frames = runs.iter_filtered_csv(
+            data_dir, 'stock_summary.csv', chunk_size)
+        with self.write_phase(run_phases):
+            run_counts = runs.load_stock_runs(
+                self.timed_frames(run_phases, frames), user,
+                checkpoint=checkpoint)
+
+        bases = populate_stock_base_data_in_db.Command(stdout=io.StringIO())
+        base_phases = {}
+        bases.prepare_stock_bases = self.timed(
+            base_phases, 'transform', bases.prepare_stock_bases)
+        with self.phase(base_phases, 'parse'):
+            fingerprint = ingest.file_fingerprint(
+                os.path.join(data_dir, 'stock_base_data.csv'))
+            df = bases.import_and_filter_csv(data_dir, 'stock_base_data.csv')
+        with self.write_phase(base_phases):
+            base_counts, _ = bases.load_stock_bases(
+                df, user, fingerprint=fingerprint)
+
+        return {
+            # rows inserted or updated
+            'stock_runs': self.summarize(run_phases, sum(run_counts[:2])),
+            'stock_bases': self.summarize(base_phases, sum(base_counts[:2])),
+        }
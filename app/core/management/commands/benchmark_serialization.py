@@ -0,0 +1,138 @@
+'''
+Benchmark list serialization of the stock API against a scratch database.
+
+Compares the DRF serializers with the .values() based fast serializers
+and reports rows/sec of both as JSON.
+'''
+import datetime
+import json
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.management.commands import benchmark_ingest
+from core.models import (Stock, StockBase)
+from stock.fast_serializers import get_fast_serializer
+from stock.serializers import (StockBaseSerializer, StockSerializer)
+
+
+class Command(BaseCommand):
+    """Measure rows/sec of the DRF and the fast list serializers.
+
+    Args:
+        BaseCommand (Command): Inherit from BaseCommand object
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=2000,
+                            help='Number of synthetic stock runs to create.')
+        parser.add_argument('--bases-per-run', type=int, default=6,
+                            help='Number of synthetic stock bases per run.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Timed rounds per serializer, the best one '
+                                 'is reported.')
+        parser.add_argument('--output',
+                            help='Write the JSON report to this file '
+                                 'instead of stdout.')
+
+    def handle(self, *args, **options):
+        with benchmark_ingest.Command().scratch_database():
+            user = get_user_model().objects.create_user(
+                'benchmark@example.com', 'benchmark')
+            self.create_data(user, options['runs'], options['bases_per_run'])
+            report = self.run_benchmark(user, options['repeat'])
+
+        report.update({
+            'created': datetime.datetime.utcnow().isoformat(),
+            'runs': options['runs'],
+            'bases_per_run': options['bases_per_run'],
+        })
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stdout.write(self.style.SUCCESS(
+                'Benchmark report written to {}'.format(options['output'])))
+        else:
+            self.stdout.write(output)
+
+    def create_data(self, user, runs, bases_per_run):
+        """Create synthetic stock runs, each with its bases linked."""
+        stocks = Stock.objects.bulk_create([
+            Stock(user=user, ticker='T{:05d}-1'.format(run),
+                  start_date=(datetime.date(2000, 1, 3)
+                              + datetime.timedelta(days=run % 5000)),
+                  end_date=(datetime.date(2001, 1, 3)
+                            + datetime.timedelta(days=run % 5000)),
+                  num_bases=bases_per_run, sector='Electronic Technology',
+                  length_run=run % 400, pct_gain=Decimal(run % 5000) / 10)
+            for run in range(runs)
+        ])
+        bases = StockBase.objects.bulk_create([
+            StockBase(user=user, stock_reference=stock, ticker=stock.ticker,
+                      base_count=count,
+                      bo_date=(stock.start_date
+                               + datetime.timedelta(days=30 * count)),
+                      base_failure='n', vol_bo=10 ** 6 + count, vol_20=10 ** 6,
+                      bo_vol_ratio=Decimal('1.25'),
+                      price_percent_range=Decimal('12.50'),
+                      base_length=count + 3, sales_0qtr=Decimal('1234.50'))
+            for stock in stocks for count in range(bases_per_run)
+        ])
+        link = Stock.bases.through
+        link.objects.bulk_create([
+            link(stock_id=base.stock_reference_id, stockbase_id=base.id)
+            for base in bases
+        ])
+
+    def best_of(self, repeat, serialize):
+        """Fastest wall time of some rounds, with the rows of the last one."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(serialize())
+            timings.append(time.perf_counter() - start)
+        return min(timings), rows
+
+    def compare(self, repeat, drf, fast):
+        """Time both serializers and report rows/sec and the speedup."""
+        report = {}
+        for name, serialize in (('drf', drf), ('fast', fast)):
+            seconds, rows = self.best_of(repeat, serialize)
+            report[name] = {
+                'rows': rows,
+                'seconds': round(seconds, 4),
+                'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+            }
+        if report['fast']['seconds']:
+            report['speedup'] = round(
+                report['drf']['seconds'] / report['fast']['seconds'], 2)
+        return report
+
+    def run_benchmark(self, user, repeat=3):
+        """Serialize the stock and stock base lists both ways.
+
+        Returns:
+            dict: per endpoint rows/sec of the DRF and the fast serializers
+        """
+        stocks = Stock.objects.filter(user=user).order_by('-id')
+        stock_fast = get_fast_serializer(StockSerializer)
+        bases = StockBase.objects.filter(user=user).order_by('ticker', 'id')
+        base_fast = get_fast_serializer(StockBaseSerializer)
+
+        return {
+            'stocks': self.compare(
+                repeat,
+                lambda: StockSerializer(
+                    stocks.prefetch_related('bases'), many=True).data,
+                lambda: stock_fast.serialize(
+                    stocks.values('id', *stock_fast.columns)),
+            ),
+            'stockbases': self.compare(
+                repeat,
+                lambda: StockBaseSerializer(bases, many=True).data,
+                lambda: base_fast.serialize(bases.values(*base_fast.columns)),
+            ),
+        }
@@ -0,0 +1,91 @@
+'''
+Show the query plans of the stock API and importer hot queries.
+
+Builds the querysets the way the viewsets do for one user and runs
+EXPLAIN ANALYZE on each, so index use can be checked against a
+production sized database.
+'''
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core import ingest
+from core.models import (Stock, StockBase)
+from stock import views
+
+
+class Command(BaseCommand):
+    """EXPLAIN ANALYZE the querysets of the stock viewsets.
+
+    Args:
+        BaseCommand (Command): Inherit from BaseCommand object
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email',
+                            help='User whose data is queried, defaults to '
+                                 'the one with most runs.')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Rows per page of the list queries.')
+        parser.add_argument('--no-analyze', action='store_true',
+                            help='Plain EXPLAIN, the queries are not run.')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['email'])
+        analyze = not options['no_analyze']
+        explain_options = {'analyze': analyze, 'buffers': analyze}
+        for name, queryset in self.querysets(user, options['page_size']):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def get_user(self, email):
+        users = get_user_model().objects
+        if email:
+            try:
+                return users.get(email=email)
+            except users.model.DoesNotExist:
+                raise CommandError('No user {}.'.format(email))
+        user = users.annotate(runs=Count('stock')).order_by('-runs').first()
+        if user is None:
+            raise CommandError('No users.')
+        return user
+
+    def view_queryset(self, viewset, user, action, **kwargs):
+        """Queryset of a viewset action, as the view builds it for the user."""
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user
+        view = viewset(request=request, action=action, format_kwarg=None,
+                       kwargs=kwargs)
+        return view.filter_queryset(view.get_queryset())
+
+    def querysets(self, user, page_size):
+        """Named querysets to explain, the hot paths of API and importer."""
+        stocks = self.view_queryset(views.StockViewSet, user, 'list')
+        stock_ids = list(stocks.values_list('id', flat=True)[:page_size])
+        bases = self.view_queryset(views.StockBaseViewSet, user, 'list')
+        latest = (StockBase.objects.filter(user=user).order_by('-bo_date')
+                  .values_list('bo_date', flat=True).first())
+        latest = latest or datetime.date.today()
+        runs = list(Stock.objects.filter(user=user)
+                    .values_list('symbol', 'run_number')[:page_size])
+
+        yield 'stock list', stocks.prefetch_related(None)[:page_size]
+        yield 'stock list bases', (
+            Stock.bases.through.objects.filter(stock_id__in=stock_ids)
+            .order_by('stock_id', 'stockbase_id')
+            .values_list('stock_id', 'stockbase__ticker'))
+        if stock_ids:
+            detail = self.view_queryset(views.StockViewSet, user, 'retrieve')
+            yield 'stock detail', (
+                detail.prefetch_related(None).filter(id=stock_ids[0]))
+        yield 'stock base list', bases[:page_size]
+        yield 'stock bases by breakout date', StockBase.objects.filter(
+            user=user,
+            bo_date__range=(latest - datetime.timedelta(days=365), latest))
+        yield 'importer run lookup', ingest.stock_ids_queryset(user, runs)
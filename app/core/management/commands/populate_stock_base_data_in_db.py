@@ -1,18 +1,51 @@
-import csv
+import io
 import os
+from collections import Counter
+from itertools import repeat
 
-import numpy as np
-from datetime import datetime
-from core.models import (StockBase, Stock)
+from core import ingest
+from core.models import DataVersion, StockBase
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
 
 import pandas as pd
+from psycopg2.extras import execute_values
 
 from app.settings import STATIC_ROOT
 
+BASE_COLUMNS = [
+    'ticker', 'base_count', 'base_failure', 'bo_date', 'vol_bo', 'vol_20',
+    'bo_vol_ratio', 'price_percent_range', 'base_length', 'sales_0qtr',
+    'stock_reference_id',
+]
+
+SOURCE_COLUMNS = BASE_COLUMNS[:-1]
+
+BASE_KEY = ['stock_reference', 'base_count']
+BASE_UPDATE_FIELDS = [
+    'user', 'ticker', 'base_failure', 'bo_date', 'vol_bo', 'vol_20',
+    'bo_vol_ratio', 'price_percent_range', 'base_length', 'sales_0qtr',
+]
+
+CHECKPOINT_NAME = 'populate_stock_base_data_in_db'
+
+
+def load_shard(df, user, batch_size=ingest.BATCH_SIZE, incremental=False,
+               checkpoint=None):
+    """Load one shard of stock bases.
+
+    Runs inside the worker processes when --workers is used, their
+    progress is reported by the parent once the shard is done.
+
+    Returns:
+        tuple: ((inserted, updated, unchanged), {unknown ticker: rows})
+    """
+    command = Command(stdout=io.StringIO())
+    return command.load_batches(df, user, batch_size, incremental, checkpoint)
+
+
 class Command(BaseCommand):
     """Populates the database with stock run CSV data.
 
@@ -20,24 +53,127 @@ class Command(BaseCommand):
         BaseCommand (Command): Inherit from BaseCommand object
     """
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default='stock_base_data.csv',
+            help='CSV, Parquet or Arrow/Feather file, relative to '
+                 'STATIC_ROOT/data/.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ingest.BATCH_SIZE,
+            help='Number of stock bases written per INSERT.',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Insert new and update changed bases even if the DB '
+                 'already has data.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes loading ticker shards in parallel.',
+        )
+
     def handle(self, *args, **options):
         file_path = STATIC_ROOT + "/data/"
-        file_name = "stock_base_data.csv"
+        file_name = options['file']
+        fingerprint = ingest.file_fingerprint(
+            os.path.join(file_path, file_name))
+        resume = ingest.has_pending_checkpoint(CHECKPOINT_NAME, fingerprint)
 
         user = get_user_model().objects.get(email=os.environ.get('USER_EMAIL'))
 
         # Uncomment to generate test data
         # df = self.import_and_filter_csv(file_path, file_name)
 
-        if not StockBase.objects.exists():
+        if resume:
+            self.stdout.write(
+                "Resuming interrupted import of {}.\n".format(file_name))
+        elif options['incremental']:
+            self.stdout.write("Incrementally importing stock base data.\n")
+        elif not StockBase.objects.exists():
             self.stdout.write("No stock base data exists in the DB.  Importing data.\n")
-            df = self.import_and_filter_csv(file_path, file_name)
-            self.add_stocks_to_db(df, user)
         else:
             self.stdout.write("Stock base data exists in DB, no further action performed.\n")
+            return
+
+        df = self.import_and_filter_csv(file_path, file_name)
+        self.load_stock_bases(df, user, options['batch_size'],
+                              options['incremental'], options['workers'],
+                              fingerprint, resume)
+
+    def load_stock_bases(self, df, user, batch_size=ingest.BATCH_SIZE,
+                         incremental=False, workers=1, fingerprint=None,
+                         resume=False):
+        """Load stock bases inline or sharded by ticker across processes.
+
+        Each worker process uses its own DB connection and commits its own
+        shard, the results are merged into one report. With a file
+        fingerprint every shard records a checkpoint per committed batch.
+
+        Args:
+            df (DataFrame): parsed stock base data
+            user (User): owner of the stock bases
+            batch_size (int): rows per statement
+            incremental (bool): upsert instead of plain inserts
+            workers (int): number of worker processes
+            fingerprint (str): fingerprint of the source file
+            resume (bool): continue from the last checkpoint
+
+        Returns:
+            tuple: ((inserted, updated, unchanged), {unknown ticker: rows})
+        """
+        shards = ingest.shard_frame(df, workers) if workers > 1 else [df]
+        checkpoints = [None] * len(shards)
+        if fingerprint:
+            names = [CHECKPOINT_NAME] if workers == 1 else [
+                '{}[{}/{}]'.format(CHECKPOINT_NAME, shard, workers)
+                for shard in range(len(shards))
+            ]
+            checkpoints = [
+                ingest.get_checkpoint(name, fingerprint, resume)
+                for name in names
+            ]
+
+        try:
+            if workers > 1:
+                with ingest.process_pool(workers) as pool:
+                    results = list(pool.map(
+                        load_shard, shards, repeat(user), repeat(batch_size),
+                        repeat(incremental), checkpoints))
+                for shard, shard_df in enumerate(shards):
+                    self.stdout.write(
+                        'Committed stock base shard {} of {}, {} rows'.format(
+                            shard + 1, len(shards), len(shard_df)))
+            else:
+                results = [self.load_batches(df, user, batch_size,
+                                             incremental, checkpoints[0])]
+        finally:
+            # committed batches are visible even if the import failed
+            DataVersion.objects.bump(user)
+
+        counts = tuple(
+            sum(shard_counts[i] for shard_counts, _ in results)
+            for i in range(3)
+        )
+        rejected = Counter()
+        for _, shard_rejected in results:
+            rejected.update(shard_rejected)
+
+        self.report_rejected(rejected)
+        self.stdout.write(
+            'Stock bases inserted: {}, updated: {}, unchanged: {}, '
+            'rejected rows: {}'.format(*counts, sum(rejected.values())))
+        return counts, dict(rejected)
 
     def import_and_filter_csv(self, file_path, file_name):
-        df = pd.read_csv(os.path.join(file_path, file_name))
+        df = next(ingest.read_frames(os.path.join(file_path, file_name),
+                                     SOURCE_COLUMNS))
 
         # maybe don't need
         # columns_with_nan = ['base_length']
@@ -53,30 +189,163 @@ class Command(BaseCommand):
 
         return df
 
-    def add_stocks_to_db(self, df, user):
-        for idx, row in df.iterrows():
-            if idx==8000:
-                break
-            else:
-                print('Adding stock base data for ticker : {} base[{}] into DB '.format(row['ticker'], row['base_count']))
-                try:
-                   stock = Stock.objects.get(ticker__iexact=row['ticker'])
-                   StockBase.objects.get_or_create(ticker=row['ticker'],
-                                                    base_count=row['base_count'],
-                                                    base_failure='n' if pd.isnull(row['base_failure']) else row['base_failure'],
-                                                    bo_date=row['bo_date'],
-                                                    vol_bo=row['vol_bo'],
-                                                    vol_20=row['vol_20'],
-                                                    bo_vol_ratio=row['bo_vol_ratio'],
-                                                    price_percent_range=None if pd.isnull(row['price_percent_range']) else row['price_percent_range'],
-                                                    base_length=None if pd.isnull(row['base_length']) else row['base_length'],
-                                                    user_id=user.id,
-                                                    stock_reference_id=stock.id,
-                                                    sales_0qtr=None if pd.isnull(row['sales_0qtr']) else row['sales_0qtr'])
-                except ObjectDoesNotExist:
-                    print("{} does not exist".format(row['ticker']))
+    def prepare_stock_bases(self, df, user):
+        """Resolve every ticker to its stock run and build fingerprinted rows.
+
+        Args:
+            df (DataFrame): parsed stock base data
+            user (User): owner of the stock bases
+
+        Returns:
+            tuple: (list of StockBase field dicts, {unknown ticker: rows})
+        """
+        stock_ids = ingest.resolve_stock_ids(user, df['ticker'].unique())
+        df = df.assign(
+            stock_reference_id=df['ticker'].str.upper().map(stock_ids))
+        missing = df['stock_reference_id'].isna()
+        rejected = df.loc[missing, 'ticker'].value_counts().to_dict()
+
+        df = df.loc[~missing].assign(
+            stock_reference_id=lambda frame: (
+                frame['stock_reference_id'].astype('int64')),
+            base_failure=lambda frame: frame['base_failure'].fillna('n'),
+            bo_date=lambda frame: frame['bo_date'].dt.date,
+        )
+        df = df[BASE_COLUMNS].drop_duplicates(
+            subset=['stock_reference_id', 'base_count'], keep='last')
+
+        records = ingest.frame_to_records(df)
+        for record in records:
+            record['source_hash'] = ingest.row_hash(record, BASE_COLUMNS)
+            record['user_id'] = user.id
+        return records, rejected
+
+    def load_batches(self, df, user, batch_size=ingest.BATCH_SIZE,
+                     incremental=False, checkpoint=None):
+        """Load a frame in batches of source rows, committing every batch.
+
+        The checkpoint is advanced in the same transaction as its batch, so
+        a rerun continues after the last committed batch.
+
+        Returns:
+            tuple: ((inserted, updated, unchanged), {unknown ticker: rows})
+        """
+        counts = (0, 0, 0)
+        rejected = Counter()
+        start = checkpoint.offset if checkpoint else 0
+        for offset in range(start, len(df), batch_size):
+            batch = df.iloc[offset:offset + batch_size]
+            with transaction.atomic():
+                batch_counts, batch_rejected = self.load_frame(
+                    batch, user, batch_size, incremental)
+                if checkpoint:
+                    checkpoint.offset = offset + len(batch)
+                    checkpoint.save(update_fields=['offset', 'updated_at'])
+            counts = tuple(a + b for a, b in zip(counts, batch_counts))
+            rejected.update(batch_rejected)
+            self.stdout.write('Committed stock bases {} of {}'.format(
+                offset + len(batch), len(df)))
+
+        if checkpoint:
+            checkpoint.completed = True
+            checkpoint.save(update_fields=['completed', 'updated_at'])
+        return counts, rejected
+
+    def load_frame(self, df, user, batch_size=ingest.BATCH_SIZE,
+                   incremental=False):
+        """Prepare and write a frame of stock bases.
+
+        Returns:
+            tuple: ((inserted, updated, unchanged), {unknown ticker: rows})
+        """
+        records, rejected = self.prepare_stock_bases(df, user)
+        adopted, records = self.adopt_stock_bases(records)
+        if incremental:
+            inserted, updated, unchanged = self.upsert_stock_bases(
+                records, batch_size)
+        else:
+            inserted = self.write_stock_bases(records, batch_size)
+            updated, unchanged = 0, len(records) - inserted
+        return (inserted, updated + adopted, unchanged), rejected
+
+    def report_rejected(self, rejected):
+        for ticker in sorted(rejected):
+            self.stdout.write("{} does not exist".format(ticker))
+
+    def adopt_stock_bases(self, records):
+        """Take over the existing bases with the identity of imported rows.
+
+        A base created through the API holds (user, ticker, base_count,
+        bo_date) under unique_stock_base, which the import keys on
+        (stock_reference, base_count) would collide with. Such bases are
+        updated in place with the imported values in one statement, unless
+        another imported base already holds their stock and base count.
+
+        Args:
+            records (list): prepared stock base rows
+
+        Returns:
+            tuple: (number of bases taken over, records left to write)
+        """
+        if not records:
+            return 0, records
+
+        names = list(records[0])
+        fields = [StockBase._meta.get_field(name) for name in names]
+        sql = (
+            'UPDATE {table} AS base SET {updates} '
+            'FROM (VALUES %s) AS source ({columns}) '
+            'WHERE base.user_id = source.user_id '
+            'AND base.ticker = source.ticker '
+            'AND base.base_count = source.base_count '
+            'AND base.bo_date = source.bo_date '
+            "AND (base.source_hash = '' OR base.stock_reference_id "
+            'IS DISTINCT FROM source.stock_reference_id) '
+            'AND NOT EXISTS (SELECT 1 FROM {table} imported '
+            'WHERE imported.stock_reference_id = source.stock_reference_id '
+            'AND imported.base_count = source.base_count '
+            "AND imported.source_hash <> '' "
+            'AND imported.id <> base.id) '
+            'RETURNING base.ticker, base.base_count, base.bo_date'
+        ).format(
+            table=StockBase._meta.db_table,
+            columns=', '.join(field.column for field in fields),
+            updates=', '.join(
+                '{0} = source.{0}'.format(field.column) for field in fields),
+        )
+        # VALUES columns are untyped text otherwise
+        template = '({})'.format(', '.join(
+            '%s::{}'.format(field.db_type(connection)) for field in fields))
+        rows = [
+            [field.get_db_prep_save(record[name], connection)
+             for name, field in zip(names, fields)]
+            for record in records
+        ]
+        with connection.cursor() as cursor:
+            adopted = set(execute_values(cursor, sql, rows, template=template,
+                                         page_size=len(rows), fetch=True))
+        if not adopted:
+            return 0, records
+        return len(adopted), [
+            record for record in records
+            if StockBase.objects.identity(record) not in adopted
+        ]
 
+    def write_stock_bases(self, records, batch_size=ingest.BATCH_SIZE):
+        """Bulk insert prepared stock bases.
 
+        Rows already written by an interrupted attempt are skipped.
 
+        Returns:
+            int: number of stock bases written
+        """
+        return ingest.insert_new(StockBase, records, batch_size)
 
+    def upsert_stock_bases(self, records, batch_size=ingest.BATCH_SIZE):
+        """Insert new and update changed prepared stock bases.
 
+        Returns:
+            tuple: (bases inserted, bases updated, bases unchanged)
+        """
+        return ingest.upsert(StockBase, records, BASE_KEY, BASE_UPDATE_FIELDS,
+                             batch_size)
@@ -1,61 +1,280 @@
-import csv
+import io
 import os
-from datetime import datetime
-from core.models import Stock
+from itertools import repeat
+
+from core import ingest
+from core.models import DataVersion, Stock, split_ticker
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.db import transaction
 
 import pandas as pd
 
 from app.settings import STATIC_ROOT
 
+CHUNK_SIZE = 10000
+
+RUN_DTYPES = {
+    'ticker': 'object',
+    'start_date': 'object',
+    'end_date': 'object',
+    'sector': 'category',
+    'num_bases': 'Int64',
+    'length_run': 'Int64',
+    'pct_gain': 'float64',
+}
+
+RUN_KEY = ['user', 'ticker', 'start_date']
+RUN_UPDATE_FIELDS = [
+    'end_date', 'sector', 'num_bases', 'length_run', 'pct_gain',
+]
+RUN_NOTES = 'Initial stock base information creation.'
+
+CHECKPOINT_NAME = 'populate_stock_run_data_in_db'
+
+
+def load_shard(df, user, incremental=False):
+    """Write one shard of stock runs in its own transaction.
+
+    Runs inside the worker processes when --workers is used.
+
+    Returns:
+        tuple: (inserted, updated, unchanged)
+    """
+    with transaction.atomic():
+        return Command(stdout=io.StringIO()).load_frame(df, user, incremental)
+
+
 class Command(BaseCommand):
     """Populates the database with stock run CSV data.
 
     Args:
         BaseCommand (Command): Inherit from BaseCommand object
     """
+    rejected_rows = 0
+    rows_read = 0
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default='stock_summary.csv',
+            help='CSV, Parquet or Arrow/Feather file, relative to '
+                 'STATIC_ROOT/data/.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Number of CSV rows read and written at a time.',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Insert new and update changed runs even if the DB '
+                 'already has data.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes loading ticker shards of each chunk '
+                 'in parallel.',
+        )
 
     def handle(self, *args, **options):
         file_path = STATIC_ROOT + "/data/"
-        file_name = "stock_summary.csv"
+        file_name = options['file']
+        fingerprint = ingest.file_fingerprint(
+            os.path.join(file_path, file_name))
+        resume = ingest.has_pending_checkpoint(CHECKPOINT_NAME, fingerprint)
 
         # Uncomment to generate test data
         # df = self.import_and_filter_csv(file_path, file_name)
 
-        if not Stock.objects.exists():
+        if resume:
+            self.stdout.write(
+                "Resuming interrupted import of {}.\n".format(file_name))
+        elif options['incremental']:
+            self.stdout.write("Incrementally importing stock run data.\n")
+        elif not Stock.objects.exists():
             self.stdout.write("No stock run data exists in the DB.  Importing data.\n")
-            df = self.import_and_filter_csv(file_path, file_name)
-            user = self.create_or_return_first_user()
-            self.add_stocks_to_db(df, user)
         else:
             self.stdout.write("Stock run data exists in DB, no further action performed.\n")
+            return
+
+        user = self.create_or_return_first_user()
+        checkpoint = ingest.get_checkpoint(
+            CHECKPOINT_NAME, fingerprint, resume)
+        frames = self.iter_filtered_csv(
+            file_path, file_name, options['chunk_size'])
+        self.load_stock_runs(frames, user, options['incremental'],
+                             options['workers'], checkpoint)
+
+    def load_stock_runs(self, frames, user, incremental=False, workers=1,
+                        checkpoint=None):
+        """Load chunks of stock runs inline or sharded by ticker across processes.
+
+        Every chunk is committed before the next one is read and the
+        checkpoint records how many source rows are done. Chunks at or before
+        the checkpoint are skipped, a chunk interrupted half way is loaded
+        again, which the inserts and upserts tolerate.
+
+        Args:
+            frames (iterable): filtered chunks of stock runs
+            user (User): owner of the stock runs
+            incremental (bool): upsert instead of plain inserts
+            workers (int): number of worker processes
+            checkpoint (ImportCheckpoint): progress of this file
+
+        Returns:
+            tuple: (inserted, updated, unchanged)
+        """
+        pool = ingest.process_pool(workers) if workers > 1 else None
+        totals = (0, 0, 0)
+        try:
+            for df in frames:
+                if checkpoint and self.rows_read <= checkpoint.offset:
+                    continue
+                if pool:
+                    shards = ingest.shard_frame(df, workers)
+                    results = list(pool.map(load_shard, shards, repeat(user),
+                                            repeat(incremental)))
+                    self.advance_checkpoint(checkpoint)
+                else:
+                    with transaction.atomic():
+                        results = [self.load_frame(df, user, incremental)]
+                        self.advance_checkpoint(checkpoint)
+                for counts in results:
+                    totals = tuple(a + b for a, b in zip(totals, counts))
+                self.stdout.write(
+                    'Loaded {} stock runs into DB'.format(sum(totals)))
+        finally:
+            if pool:
+                pool.shutdown()
+            # committed chunks are visible even if the import failed
+            DataVersion.objects.bump(user)
+
+        if checkpoint:
+            checkpoint.completed = True
+            checkpoint.save(update_fields=['completed', 'updated_at'])
+
+        self.stdout.write(
+            'Stock runs inserted: {}, updated: {}, unchanged: {}, '
+            'rejected rows: {}'.format(*totals, self.rejected_rows))
+        return totals
+
+    def advance_checkpoint(self, checkpoint):
+        if checkpoint:
+            checkpoint.offset = self.rows_read
+            checkpoint.save(update_fields=['offset', 'updated_at'])
 
     def import_and_filter_csv(self, file_path, file_name):
-        df = pd.read_csv(os.path.join(file_path, file_name))
+        df = next(ingest.read_frames(os.path.join(file_path, file_name),
+                                     list(RUN_DTYPES), RUN_DTYPES))
+        df = self.filter_stock_runs(df)
+        self.generate_test_data(df, "import_filter_test.csv", False)
+        return df
+
+    def iter_filtered_csv(self, file_path, file_name, chunk_size=CHUNK_SIZE):
+        """Stream the input file in fixed size chunks so memory stays flat.
+
+        Args:
+            file_path (str): directory of the input file
+            file_name (str): CSV, Parquet or Arrow/Feather file name
+            chunk_size (int): rows per chunk
+
+        Yields:
+            DataFrame: filtered chunk of stock runs
+        """
+        chunks = ingest.read_frames(os.path.join(file_path, file_name),
+                                    list(RUN_DTYPES), RUN_DTYPES, chunk_size)
+        for chunk in chunks:
+            filtered = self.filter_stock_runs(chunk)
+            self.rows_read += len(chunk)
+            self.rejected_rows += len(chunk) - len(filtered)
+            yield filtered
+
+    def filter_stock_runs(self, df):
+        """Drop runs which have not finished yet and parse the dates."""
         symbols_to_drop = ['tbd', 'Tbd']
         date_columns = ['start_date', 'end_date']
-        for symbol in symbols_to_drop:
-            df.drop(df.index[df['end_date'] == symbol], inplace = True)
+        df = df[~df['end_date'].isin(symbols_to_drop)]
         df = df.dropna(subset=['end_date'])
         for col in date_columns:
-            df[col] =  pd.to_datetime(df[col])
-        self.generate_test_data(df,"import_filter_test.csv", False)
+            df = df.assign(**{col: pd.to_datetime(df[col]).dt.date})
         return df
 
+    def prepare_stock_runs(self, df, user):
+        """Build fingerprinted rows which are unique on the natural key.
+
+        Args:
+            df (DataFrame): filtered stock runs
+            user (User): owner of the stock runs
+
+        Returns:
+            list: dicts of Stock field values
+        """
+        columns = list(RUN_DTYPES)
+        df = df[columns].drop_duplicates(subset=RUN_KEY[1:], keep='last')
+        records = ingest.frame_to_records(df)
+        for record in records:
+            record['source_hash'] = ingest.row_hash(record, columns)
+            record['user_id'] = user.id
+            record['stock_run_notes'] = RUN_NOTES
+            record['symbol'], record['run_number'] = split_ticker(
+                record['ticker'])
+        return records
+
+    def load_frame(self, df, user, incremental=False):
+        """Write a frame of stock runs.
+
+        Runs skipped by a plain import are counted as unchanged.
+
+        Returns:
+            tuple: (inserted, updated, unchanged)
+        """
+        if incremental:
+            return self.upsert_stocks_to_db(df, user)
+        records = self.prepare_stock_runs(df, user)
+        inserted = self.write_stock_runs(records)
+        return inserted, 0, len(records) - inserted
+
     def add_stocks_to_db(self, df, user):
-        for idx, row in df.iterrows():
-            print('Adding stock data for {} into DB '.format(row['ticker']))
-            Stock.objects.get_or_create(ticker=row['ticker'],
-                                    start_date=row['start_date'],
-                                    end_date=row['end_date'],
-                                    sector=row['sector'],
-                                    num_bases=row['num_bases'],
-                                    length_run=row['length_run'],
-                                    pct_gain=row['pct_gain'],
-                                    user_id=user.id,
-                                    stock_run_notes='Initial stock base information creation.')
+        """Bulk insert a frame of stock runs in one transaction.
+
+        Args:
+            df (DataFrame): filtered stock runs
+            user (User): owner of the stock runs
+
+        Returns:
+            int: number of stock runs written
+        """
+        return self.write_stock_runs(self.prepare_stock_runs(df, user))
+
+    def write_stock_runs(self, records):
+        """Bulk insert prepared stock runs.
+
+        Runs already written by an interrupted attempt are skipped.
+
+        Returns:
+            int: number of stock runs written
+        """
+        return ingest.insert_new(Stock, records)
+
+    def upsert_stocks_to_db(self, df, user):
+        """Insert new and update changed stock runs of a frame.
+
+        Args:
+            df (DataFrame): filtered stock runs
+            user (User): owner of the stock runs
+
+        Returns:
+            tuple: (runs inserted, runs updated, runs unchanged)
+        """
+        records = self.prepare_stock_runs(df, user)
+        with transaction.atomic():
+            return ingest.upsert(Stock, records, RUN_KEY, RUN_UPDATE_FIELDS)
 
 
     def create_or_return_first_user(self):
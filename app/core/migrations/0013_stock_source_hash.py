@@ -0,0 +1,43 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_alter_stockbase_price_percent_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='stockbase',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        # Key the oldest existing row of every natural key so that the first
+        # incremental import updates it instead of inserting a duplicate.
+        migrations.RunSQL(
+            sql=[
+                "UPDATE core_stock SET source_hash = 'legacy' WHERE id IN ("
+                "SELECT MIN(id) FROM core_stock GROUP BY user_id, ticker, start_date)",
+                "UPDATE core_stockbase SET source_hash = 'legacy' WHERE id IN ("
+                "SELECT MIN(id) FROM core_stockbase WHERE stock_reference_id IS NOT NULL "
+                "GROUP BY stock_reference_id, base_count)",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_hash', ''), _negated=True), fields=('user', 'ticker', 'start_date'), name='unique_imported_stock_run'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockbase',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_hash', ''), _negated=True), fields=('stock_reference', 'base_count'), name='unique_imported_stock_base'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.10 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_stock_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importcheckpoint',
+            constraint=models.UniqueConstraint(fields=('name', 'fingerprint'), name='unique_import_checkpoint'),
+        ),
+    ]
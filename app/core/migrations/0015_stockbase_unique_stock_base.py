@@ -0,0 +1,40 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_importcheckpoint'),
+    ]
+
+    operations = [
+        # Merge duplicated bases into the oldest one, preferring imported rows,
+        # and move their stock links over before adding the constraint. The
+        # deferred FK checks of the deletes are fired right away, ALTER TABLE
+        # refuses to run with trigger events pending.
+        migrations.RunSQL(
+            sql=[
+                "SET CONSTRAINTS ALL IMMEDIATE",
+                "CREATE TEMPORARY TABLE stockbase_duplicate AS "
+                "SELECT id, keep_id FROM ("
+                "SELECT id, FIRST_VALUE(id) OVER ("
+                "PARTITION BY user_id, ticker, base_count, bo_date "
+                "ORDER BY source_hash = '', id) AS keep_id FROM core_stockbase"
+                ") ranked WHERE id <> keep_id",
+                "INSERT INTO core_stock_bases (stock_id, stockbase_id) "
+                "SELECT link.stock_id, duplicate.keep_id FROM core_stock_bases link "
+                "JOIN stockbase_duplicate duplicate ON duplicate.id = link.stockbase_id "
+                "ON CONFLICT DO NOTHING",
+                "DELETE FROM core_stock_bases WHERE stockbase_id IN (SELECT id FROM stockbase_duplicate)",
+                "DELETE FROM core_stockbase WHERE id IN (SELECT id FROM stockbase_duplicate)",
+                "DROP TABLE stockbase_duplicate",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='stockbase',
+            constraint=models.UniqueConstraint(fields=('user', 'ticker', 'base_count', 'bo_date'), name='unique_stock_base'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:28
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the tables against writes.
+    atomic = False
+
+    dependencies = [
+        ('core', '0016_dataversion'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(fields=['user', '-id'], name='stock_user_id_desc_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(django.db.models.functions.text.Upper('ticker'), name='stock_ticker_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stockbase',
+            index=models.Index(fields=['user', 'ticker', 'id'], name='stockbase_user_ticker_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stockbase',
+            index=models.Index(fields=['user', 'bo_date'], name='stockbase_user_bo_date_idx'),
+        ),
+    ]
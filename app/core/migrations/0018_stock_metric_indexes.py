@@ -0,0 +1,24 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:34
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the tables against writes.
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_stock_query_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(fields=['user', 'pct_gain', 'id'], name='stock_user_pct_gain_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(fields=['user', 'start_date', 'id'], name='stock_user_start_date_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# Index the UPPER(ticker) LIKE 'prefix%' lookups of the ticker search
+# whatever the collation of the database. Operator classes can not be
+# given to expression indexes in Meta.indexes with this Django version.
+INDEXES = [
+    ('stock_user_ticker_prefix_idx', 'core_stock'),
+    ('stockbase_user_ticker_prefix_idx', 'core_stockbase'),
+]
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the tables against writes.
+    atomic = False
+
+    dependencies = [
+        ('core', '0018_stock_metric_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (user_id, UPPER(ticker) text_pattern_ops)'.format(
+                name, table),
+            'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name),
+        )
+        for name, table in INDEXES
+    ]
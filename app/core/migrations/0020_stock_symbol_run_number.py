@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:38
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the tables against writes.
+    atomic = False
+
+    dependencies = [
+        ('core', '0019_ticker_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='run_number',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='symbol',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        # Split the existing tickers the way core.models.split_ticker does.
+        migrations.RunSQL(
+            sql=(
+                "UPDATE core_stock SET "
+                "symbol = COALESCE(SUBSTRING(UPPER(TRIM(ticker)) FROM '^(.*)-[0-9]+$'), UPPER(TRIM(ticker))), "
+                "run_number = SUBSTRING(TRIM(ticker) FROM '^.*-([0-9]+)$')::integer"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(fields=['user', 'symbol', 'run_number'], name='stock_user_symbol_run_idx'),
+        ),
+        # The importer no longer looks runs up by UPPER(ticker).
+        RemoveIndexConcurrently(
+            model_name='stock',
+            name='stock_ticker_upper_idx',
+        ),
+    ]
@@ -1,9 +1,13 @@
 '''
 DB Models
 '''
+import re
+
 from django.conf import settings
 
-from django.db import models
+from django.db import connections, models
+from django.utils import timezone
+from psycopg2.extras import execute_values
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -44,8 +48,47 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+RUN_TICKER = re.compile(r'(.*)-([0-9]+)')
+
+
+def split_ticker(ticker):
+    """Split a run ticker like AAPL-2 into its symbol and run number.
+
+    Args:
+        ticker (str): ticker of a stock run, any case
+
+    Returns:
+        tuple: (SYMBOL, run number), run number None without a -N suffix
+    """
+    ticker = str(ticker).strip().upper()
+    match = RUN_TICKER.fullmatch(ticker)
+    if match is None:
+        return ticker, None
+    return match.group(1), int(match.group(2))
+
+
+class StockManager(models.Manager):
+    """Manager for stock runs, keeping symbol and run number in step with the
+    ticker."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        for obj in objs:
+            obj.set_symbol()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'ticker' in fields:
+            for obj in objs:
+                obj.set_symbol()
+            fields = list(fields) + ['symbol', 'run_number']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Stock(models.Model):
     """Stock Ticker object.  Each ticker is an individual stock run
+
+    The ticker packs the symbol and the run number (AAPL-2), both are
+    also stored on their own, indexed, for lookups by symbol and run.
     """
 
     #TODO: Add TextChoices for each sector
@@ -56,6 +99,8 @@ class Stock(models.Model):
     ) # maybe consider removing the cascaded delete, we want to keep stocks even if user is deleted
 
     ticker=models.CharField(max_length=10)
+    symbol = models.CharField(max_length=10, blank=True, default='')
+    run_number = models.PositiveIntegerField(blank=True, null=True)
     start_date=models.DateField()
     end_date= models.DateField()
     num_bases=models.IntegerField()
@@ -63,12 +108,183 @@ class Stock(models.Model):
     length_run=models.IntegerField()
     pct_gain=models.DecimalField(max_digits=7, decimal_places=1)
     stock_run_notes = models.TextField(blank=True)
+    source_hash = models.CharField(max_length=32, blank=True, default='')
 
     bases = models.ManyToManyField('StockBase')
 
+    objects = StockManager()
+
+    class Meta:
+        constraints = [
+            # Natural key of imported runs, used by incremental imports.
+            models.UniqueConstraint(
+                fields=['user', 'ticker', 'start_date'],
+                condition=~models.Q(source_hash=''),
+                name='unique_imported_stock_run',
+            ),
+        ]
+        indexes = [
+            # The run list of a user, newest first.
+            models.Index(fields=['user', '-id'],
+                         name='stock_user_id_desc_idx'),
+            # Runs of a symbol, and the run a stock base belongs to.
+            models.Index(fields=['user', 'symbol', 'run_number'],
+                         name='stock_user_symbol_run_idx'),
+            # Range filters and ordering of the run list on its metrics.
+            models.Index(fields=['user', 'pct_gain', 'id'],
+                         name='stock_user_pct_gain_idx'),
+            models.Index(fields=['user', 'start_date', 'id'],
+                         name='stock_user_start_date_idx'),
+        ]
+
     def __str__(self):
         return self.ticker
 
+    def set_symbol(self):
+        """Derive symbol and run number from the ticker."""
+        self.symbol, self.run_number = split_ticker(self.ticker)
+
+    def save(self, *args, **kwargs):
+        self.set_symbol()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'ticker' in update_fields:
+            kwargs['update_fields'] = (
+                list(update_fields) + ['symbol', 'run_number'])
+        super().save(*args, **kwargs)
+
+
+class StockBaseManager(models.Manager):
+    """Manager for stock bases"""
+
+    # Fields which identify a stock base of a user.
+    IDENTITY_FIELDS = ['user', 'ticker', 'base_count', 'bo_date']
+
+    def _find(self, user, keys, names=()):
+        """Map identity keys of a user's stock bases to their ids in one query.
+
+        Args:
+            user (User): owner of the stock bases
+            keys (iterable): identity keys to look up
+            names (iterable): fields whose stored values are read as well
+
+        Returns:
+            dict: {identity key: (id, {field name: stored value})}
+        """
+        names = sorted(names)
+        rows = self.filter(
+            user=user,
+            ticker__in={key[0] for key in keys},
+            base_count__in={key[1] for key in keys},
+            bo_date__in={key[2] for key in keys},
+        ).values_list('ticker', 'base_count', 'bo_date', 'id', *names)
+        return {
+            tuple(row[:3]): (row[3], dict(zip(names, row[4:])))
+            for row in rows if tuple(row[:3]) in keys
+        }
+
+    def identity(self, base):
+        """Identity key of a dict of stock base field values, user aside."""
+        return (base['ticker'], base['base_count'], base['bo_date'])
+
+    def get_or_create_many(self, user, bases):
+        """Fetch or create stock bases, see resolve_many.
+
+        Returns:
+            list: ids of the stock bases, without duplicates
+        """
+        ids, _ = self.resolve_many(user, bases)
+        return sorted(set(ids.values()))
+
+    def resolve_many(self, user, bases):
+        """Create or update stock bases by their identity in constant queries.
+
+        Existing bases are looked up with one query. The missing ones, and
+        the ones whose stored values differ from the given ones, are sent
+        in one INSERT ... ON CONFLICT DO UPDATE RETURNING id per set of
+        given fields, so concurrent writers can not create duplicates and
+        only the given fields of an existing base are rewritten.
+
+        Args:
+            user (User): owner of the stock bases
+            bases (list): dicts of stock base field values
+
+        Returns:
+            tuple: ({identity key: id} of the stock bases,
+                set of ids of the bases created or updated)
+        """
+        if not bases:
+            return {}, set()
+
+        wanted = {}
+        for base in bases:
+            wanted.setdefault(self.identity(base), base)
+        names = {name for base in wanted.values() for name in base}
+        found = self._find(user, wanted, names)
+        ids = {key: base_id for key, (base_id, _) in found.items()}
+
+        groups = {}
+        for key, base in wanted.items():
+            stored = found.get(key, (None, None))[1]
+            if stored is None or any(stored[name] != value
+                                     for name, value in base.items()):
+                groups.setdefault(tuple(sorted(base)), []).append(base)
+
+        written = set()
+        for given, group in groups.items():
+            for key, base_id in self._upsert(user, given, group):
+                ids[key] = base_id
+                written.add(base_id)
+        return ids, written
+
+    def _upsert(self, user, given, bases):
+        """INSERT ... ON CONFLICT DO UPDATE the given fields of bases.
+
+        Returns:
+            list: (identity key, id) of the written bases
+        """
+        fields = [
+            field for field in self.model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        keys = [
+            self.model._meta.get_field(name).column
+            for name in self.IDENTITY_FIELDS
+        ]
+        updates = [
+            self.model._meta.get_field(name).column
+            for name in given
+        ]
+        updates = [column for column in updates if column not in keys]
+        sql = (
+            'INSERT INTO {table} ({columns}) VALUES %s '
+            'ON CONFLICT ({keys}) DO UPDATE SET {updates} '
+            'RETURNING ticker, base_count, bo_date, id'
+        ).format(
+            table=self.model._meta.db_table,
+            columns=', '.join(field.column for field in fields),
+            keys=', '.join(keys),
+            # a no-op assignment keeps RETURNING rows of unchanged keys
+            updates=', '.join(
+                '{0} = EXCLUDED.{0}'.format(column)
+                for column in updates or keys[1:2]
+            ),
+        )
+
+        connection = connections[self.db]
+        rows = []
+        for base in bases:
+            obj = self.model(user=user, **base)
+            rows.append([
+                field.get_db_prep_save(getattr(obj, field.attname), connection)
+                for field in fields
+            ])
+
+        with connection.cursor() as cursor:
+            written = execute_values(cursor, sql, rows,
+                                     page_size=len(rows), fetch=True)
+        return [(tuple(row[:3]), row[3]) for row in written]
+
+
 class StockBase(models.Model):
     """Stock base object.
 
@@ -99,6 +315,7 @@ class StockBase(models.Model):
     bo_vol_ratio=models.DecimalField(max_digits=4, decimal_places=2, blank=True, null=True)
     price_percent_range=models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True)
     base_length=models.IntegerField(blank=True, null=True)
+    source_hash = models.CharField(max_length=32, blank=True, default='')
 
     #fundies
     sales_0qtr = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
@@ -157,6 +374,102 @@ class StockBase(models.Model):
     # sales_2qtr_yoy = models.DecimalField(max_digits=10, decimal_places=2, blank=True)
     # sales_3qtr_yoy = models.DecimalField(max_digits=10, decimal_places=2, blank=True)
 
+    objects = StockBaseManager()
+
+    class Meta:
+        constraints = [
+            # Natural key of imported bases, used by incremental imports.
+            models.UniqueConstraint(
+                fields=['stock_reference', 'base_count'],
+                condition=~models.Q(source_hash=''),
+                name='unique_imported_stock_base',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'ticker', 'base_count', 'bo_date'],
+                name='unique_stock_base',
+            ),
+        ]
+        indexes = [
+            # The base list of a user, ordered by ticker then id.
+            models.Index(fields=['user', 'ticker', 'id'],
+                         name='stockbase_user_ticker_idx'),
+            # Breakout date ranges of a user.
+            models.Index(fields=['user', 'bo_date'],
+                         name='stockbase_user_bo_date_idx'),
+        ]
+
     def __str__(self):
         return self.ticker
 
+
+class ImportCheckpoint(models.Model):
+    """Progress of a bulk import, so an interrupted import can resume.
+
+    offset - number of source rows of the file committed so far.
+    """
+    name = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    offset = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'fingerprint'],
+                name='unique_import_checkpoint',
+            ),
+        ]
+
+    def __str__(self):
+        return '{} @ {}'.format(self.name, self.offset)
+
+
+class DataVersionManager(models.Manager):
+    """Manager for data versions"""
+
+    def bump(self, user):
+        """Increase the data version of a user with a single upsert.
+
+        Args:
+            user (User): user, or user id, whose stock data changed
+        """
+        sql = (
+            'INSERT INTO {table} (user_id, version, updated_at) '
+            'VALUES (%s, 1, %s) '
+            'ON CONFLICT (user_id) DO UPDATE '
+            'SET version = {table}.version + 1, '
+            'updated_at = EXCLUDED.updated_at'
+        ).format(table=self.model._meta.db_table)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [getattr(user, 'pk', user), timezone.now()])
+
+    def current(self, user):
+        """Data version of a user, version 0 until the first change.
+
+        Returns:
+            tuple: (version, updated_at or None)
+        """
+        row = (self.filter(user=user)
+               .values_list('version', 'updated_at').first())
+        return row or (0, None)
+
+
+class DataVersion(models.Model):
+    """Version of a user's stock runs and bases.
+
+    Bumped by every write through the API and the import commands, used to
+    answer conditional requests without reading the stock tables.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = DataVersionManager()
+
+    def __str__(self):
+        return '{} v{}'.format(self.user_id, self.version)
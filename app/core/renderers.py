@@ -0,0 +1,45 @@
+'''
+Fast JSON rendering of API responses with orjson.
+
+Falls back to the DRF renderer when orjson is not installed.
+'''
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer on top of orjson.
+
+    Dates, datetimes and UUIDs are encoded natively. Decimals are strings
+    unless COERCE_DECIMAL_TO_STRING is False in REST_FRAMEWORK, then they
+    are numbers. Indented output, e.g. for the browsable API, and a missing
+    orjson fall back to the DRF renderer.
+    """
+
+    def __init__(self):
+        self.encoder = encoders.JSONEncoder()
+
+    def default(self, obj):
+        """Encode what orjson does not know natively."""
+        if isinstance(obj, Decimal):
+            if api_settings.COERCE_DECIMAL_TO_STRING:
+                return str(obj)
+            return float(obj)
+        return self.encoder.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent:
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self.default,
+                            option=orjson.OPT_UTC_Z)
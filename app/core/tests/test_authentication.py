@@ -0,0 +1,113 @@
+"""
+Tests for the cached token authentication.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+STOCKS_URL = reverse('stock:stock-list')
+SELF_URL = reverse('user:me')
+
+
+# stands in for the Redis shared by all workers
+SHARED_CACHES = {
+    **settings.CACHES,
+    settings.AUTH_TOKEN_CACHE: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared-auth-tokens',
+        'TIMEOUT': settings.AUTH_TOKEN_CACHE_TIMEOUT,
+    },
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        caches[settings.AUTH_TOKEN_CACHE].clear()
+        caches[settings.STOCK_API_CACHE].clear()
+        self.user = get_user_model().objects.create_user(
+            email='token@example.com', password='testP@ssw0rd24601')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.client.get(SELF_URL).status_code,
+                         status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(SELF_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_stock_endpoints_use_the_cache(self):
+        self.client.get(STOCKS_URL)
+
+        # only the data version of the conditional GET
+        with self.assertNumQueries(1):
+            res = self.client.get(STOCKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        self.assertEqual(self.client.get(SELF_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_is_forgotten(self):
+        self.client.get(SELF_URL)
+
+        self.token.delete()
+
+        self.assertEqual(self.client.get(SELF_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_forgotten(self):
+        self.client.get(SELF_URL)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(SELF_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_is_picked_up(self):
+        self.client.get(SELF_URL)
+
+        self.client.patch(SELF_URL, {'password': 'newP@ssw0rd24601'})
+        res = self.client.get(SELF_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            res.wsgi_request.user.check_password('newP@ssw0rd24601'))
+
+
+class UnsharedTokenCacheTests(TestCase):
+    """Without a shared cache no worker keeps token lookups of its own."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='token@example.com', password='testP@ssw0rd24601')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_changes_made_elsewhere_are_seen_at_once(self):
+        self.assertEqual(self.client.get(SELF_URL).status_code,
+                         status.HTTP_200_OK)
+
+        # as another worker's change looks to this one, no signal fires here
+        users = get_user_model().objects.filter(pk=self.user.pk)
+        users.update(is_active=False)
+
+        self.assertEqual(self.client.get(SELF_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
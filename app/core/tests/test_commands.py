@@ -4,27 +4,50 @@ Test Django management commands
 DJacobson 8/26/2022
 '''
 
+from contextlib import redirect_stdout
 from dataclasses import dataclass
+from unittest import skipUnless
 from unittest.mock import patch
 from io import StringIO
+import os
+import tempfile
 import pytz
 
 from decimal import Decimal
 import datetime
 
+import numpy as np
+import pandas as pd
 from pandas.testing import assert_frame_equal
 from psycopg2 import OperationalError as Psycopg2Error
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import TransactionTestCase
 from django.contrib.auth import get_user_model
 
-from core.models import Stock
+from core import ingest
+from core.management.commands import (
+    benchmark_ingest,
+    benchmark_serialization,
+    populate_stock_base_data_in_db,
+    populate_stock_run_data_in_db,
+)
+from core.models import DataVersion, ImportCheckpoint, Stock, StockBase
 
 from app.settings import STATIC_ROOT
 
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+DATA_DIR = os.path.join(STATIC_ROOT, 'data')
+TEST_RUNS = 'stock_summary_test.csv'
+
 
 @patch("core.management.commands.wait_for_db.Command.check")
 class WaitForDbCommandTests(SimpleTestCase):
@@ -79,3 +102,410 @@ class PopulateDbOnStartupTests(TestCase):
         # self.assertEqual(out, "")
 
 
+class PopulateStockBaseTests(TestCase):
+
+    def setUp(self):
+        self.stock = create_stock(ticker='AAPL-1')
+        self.user = self.stock.user
+
+    def base_frame(self):
+        return pd.DataFrame({
+            'ticker': ['aapl-1', 'AAPL-1', 'MSFT-1'],
+            'base_count': [1, 2, 1],
+            'base_failure': [None, 'y', 'n'],
+            'bo_date': pd.to_datetime(
+                ['2004-08-02', '2005-01-10', '2004-08-02']),
+            'vol_bo': [371198872, np.nan, 1000],
+            'vol_20': [175539248, np.nan, 1000],
+            'bo_vol_ratio': [2.11, np.nan, 1.0],
+            'price_percent_range': [11.3, np.nan, 10.0],
+            'base_length': [6, np.nan, 4],
+            'sales_0qtr': [1428.0, np.nan, 10.0],
+        })
+
+    def test_add_stock_bases_in_bulk(self):
+        """Known tickers are resolved in one query and written in batches."""
+        command = populate_stock_base_data_in_db.Command(stdout=StringIO())
+
+        # savepoint, resolve tickers, take over API bases, insert, release,
+        # bump the data version
+        with self.assertNumQueries(6):
+            counts, rejected = command.load_stock_bases(
+                self.base_frame(), self.user)
+
+        self.assertEqual(counts, (2, 0, 0))
+        self.assertEqual(DataVersion.objects.current(self.user)[0], 1)
+        self.assertEqual(rejected, {'MSFT-1': 1})
+        bases = StockBase.objects.order_by('base_count')
+        self.assertEqual(bases.count(), 2)
+        self.assertTrue(all(base.stock_reference_id == self.stock.id
+                            for base in bases))
+        self.assertEqual(bases[0].base_failure, 'n')
+        self.assertEqual(bases[0].bo_date, datetime.date(2004, 8, 2))
+        self.assertEqual(bases[0].vol_bo, 371198872)
+        self.assertEqual(bases[0].bo_vol_ratio, Decimal('2.11'))
+        self.assertIsNone(bases[1].vol_bo)
+        self.assertIsNone(bases[1].sales_0qtr)
+
+    def test_runs_resolved_by_symbol_and_run_number(self):
+        """Tickers match the user's runs on symbol and run number."""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpassword123')
+        Stock.objects.create(
+            user=other, ticker='MSFT-1', start_date=datetime.date(2004, 1, 1),
+            end_date=datetime.date(2005, 1, 1), num_bases=1,
+            sector='Technology Services', length_run=90,
+            pct_gain=Decimal('10.0'))
+
+        stock_ids = ingest.resolve_stock_ids(
+            self.user, ['aapl-01', 'AAPL-2', 'MSFT-1', 'AAPL'])
+
+        self.assertEqual(stock_ids, {'AAPL-01': self.stock.id})
+
+    def test_unknown_tickers_are_reported(self):
+        out = StringIO()
+        command = populate_stock_base_data_in_db.Command(stdout=out)
+
+        command.load_stock_bases(self.base_frame(), self.user)
+
+        self.assertIn('MSFT-1 does not exist', out.getvalue())
+        self.assertFalse(StockBase.objects.filter(ticker='MSFT-1').exists())
+
+    def test_import_takes_over_api_created_bases(self):
+        """A base created through the API becomes the imported base."""
+        for incremental in [False, True]:
+            with self.subTest(incremental=incremental):
+                StockBase.objects.all().delete()
+                api_id, = StockBase.objects.get_or_create_many(self.user, [
+                    {'ticker': 'aapl-1', 'base_count': 1,
+                     'bo_date': datetime.date(2004, 8, 2), 'vol_bo': 5},
+                ])
+                command = populate_stock_base_data_in_db.Command(
+                    stdout=StringIO())
+
+                counts, _ = command.load_stock_bases(
+                    self.base_frame(), self.user, incremental=incremental)
+
+                self.assertEqual(counts, (1, 1, 0))
+                self.assertEqual(StockBase.objects.count(), 2)
+                base = StockBase.objects.get(id=api_id)
+                self.assertEqual(base.stock_reference, self.stock)
+                self.assertEqual(base.vol_bo, 371198872)
+                self.assertNotEqual(base.source_hash, '')
+
+    def test_interrupted_import_resumes_from_checkpoint(self):
+        """Committed batches are recorded and skipped when resuming."""
+        command = populate_stock_base_data_in_db.Command(stdout=StringIO())
+        load_frame = command.load_frame
+        loaded = []
+
+        def interrupt_after_first_batch(*args):
+            if loaded:
+                raise OperationalError
+            loaded.append(args)
+            return load_frame(*args)
+
+        with patch.object(command, 'load_frame',
+                          side_effect=interrupt_after_first_batch):
+            with self.assertRaises(OperationalError):
+                command.load_stock_bases(self.base_frame(), self.user,
+                                         batch_size=1, fingerprint='abc')
+
+        checkpoint = ImportCheckpoint.objects.get(fingerprint='abc')
+        self.assertEqual(checkpoint.offset, 1)
+        self.assertFalse(checkpoint.completed)
+        self.assertEqual(StockBase.objects.count(), 1)
+
+        command = populate_stock_base_data_in_db.Command(stdout=StringIO())
+        counts, _ = command.load_stock_bases(self.base_frame(), self.user,
+                                             batch_size=1, fingerprint='abc',
+                                             resume=True)
+
+        self.assertEqual(counts, (1, 0, 0))
+        self.assertEqual(StockBase.objects.count(), 2)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.offset, 3)
+        self.assertTrue(checkpoint.completed)
+
+    def test_plain_import_counts_skipped_bases(self):
+        command = populate_stock_base_data_in_db.Command(stdout=StringIO())
+        command.load_stock_bases(self.base_frame(), self.user)
+
+        counts, _ = command.load_stock_bases(self.base_frame(), self.user)
+
+        self.assertEqual(counts, (0, 0, 2))
+        self.assertEqual(StockBase.objects.count(), 2)
+
+    def test_incremental_import_only_writes_changes(self):
+        command = populate_stock_base_data_in_db.Command(stdout=StringIO())
+        df = self.base_frame()
+
+        counts, _ = command.load_stock_bases(df, self.user, incremental=True)
+        self.assertEqual(counts, (2, 0, 0))
+        df.loc[1, 'base_failure'] = 'n'
+        counts, _ = command.load_stock_bases(df, self.user, incremental=True)
+        self.assertEqual(counts, (0, 1, 1))
+
+        self.assertEqual(StockBase.objects.count(), 2)
+        self.assertEqual(StockBase.objects.get(base_count=2).base_failure, 'n')
+
+
+class ShardedLoadTests(TransactionTestCase):
+
+    def test_shards_keep_tickers_together(self):
+        df = pd.DataFrame({
+            'ticker': ['AAPL-1', 'aapl-1', 'AMD-1', 'NVDA-1', 'SQ-1', 'AMD-1'],
+        })
+
+        shards = ingest.shard_frame(df, 3)
+
+        self.assertEqual(sum(len(shard) for shard in shards), len(df))
+        for shard in shards:
+            others = pd.concat(
+                [other for other in shards if other is not shard])
+            self.assertFalse(set(shard['ticker'].str.upper())
+                             & set(others['ticker'].str.upper()))
+
+    def test_load_stock_bases_with_workers(self):
+        """Worker processes write their shards and the totals are merged."""
+        stocks = [create_stock(ticker='AAPL-1')]
+        stocks.append(Stock.objects.create(
+            user=stocks[0].user, ticker='AMD-1',
+            start_date=datetime.date(2016, 1, 1),
+            end_date=datetime.date(2017, 1, 1), num_bases=2, sector='Tech',
+            length_run=50, pct_gain=Decimal('10.0')))
+        df = pd.DataFrame({
+            'ticker': ['AAPL-1', 'AAPL-1', 'AMD-1', 'MSFT-1'],
+            'base_count': [1, 2, 1, 1],
+            'base_failure': ['n', None, 'y', 'n'],
+            'bo_date': pd.to_datetime(
+                ['2004-08-02', '2005-01-10', '2016-05-02', '2004-08-02']),
+            'vol_bo': [1, 2, 3, 4],
+            'vol_20': [1, 2, 3, 4],
+            'bo_vol_ratio': [1.0, 1.0, 1.0, 1.0],
+            'price_percent_range': [1.0, 1.0, 1.0, 1.0],
+            'base_length': [1, 2, 3, 4],
+            'sales_0qtr': [1.0, 1.0, 1.0, 1.0],
+        })
+        command = populate_stock_base_data_in_db.Command(stdout=StringIO())
+
+        counts, rejected = command.load_stock_bases(
+            df, stocks[0].user, workers=2)
+
+        self.assertEqual(counts, (3, 0, 0))
+        self.assertEqual(rejected, {'MSFT-1': 1})
+        bases = StockBase.objects
+        self.assertEqual(bases.filter(stock_reference=stocks[0]).count(), 2)
+        self.assertEqual(bases.filter(stock_reference=stocks[1]).count(), 1)
+        self.assertIn('Committed stock base shard 2 of 2',
+                      command.stdout.getvalue())
+
+    def test_shards_write_no_progress_of_their_own(self):
+        user = get_user_model().objects.create_user(
+            'quiet@example.com', 'testpassword123')
+        df = pd.DataFrame({
+            'ticker': ['MSFT-1'], 'base_count': [1], 'base_failure': ['n'],
+            'bo_date': pd.to_datetime(['2004-08-02']), 'vol_bo': [1],
+            'vol_20': [1], 'bo_vol_ratio': [1.0], 'price_percent_range': [1.0],
+            'base_length': [1], 'sales_0qtr': [1.0],
+        })
+
+        with redirect_stdout(StringIO()) as stdout:
+            counts, rejected = populate_stock_base_data_in_db.load_shard(
+                df, user)
+
+        self.assertEqual(rejected, {'MSFT-1': 1})
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test_load_stock_runs_with_workers(self):
+        user = get_user_model().objects.create_user(
+            'runs@example.com', 'testpassword123')
+        command = populate_stock_run_data_in_db.Command(stdout=StringIO())
+        frames = command.iter_filtered_csv(DATA_DIR, TEST_RUNS, chunk_size=5)
+
+        totals = command.load_stock_runs(
+            frames, user, incremental=True, workers=2)
+
+        self.assertEqual(totals, (9, 0, 0))
+        self.assertEqual(Stock.objects.filter(user=user).count(), 9)
+
+
+class PopulateStockRunTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'runs@example.com',
+            'testpassword123',
+        )
+        self.command = populate_stock_run_data_in_db.Command(stdout=StringIO())
+
+    def test_streamed_chunks_are_filtered(self):
+        """Unfinished runs are dropped in every chunk."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'stock_summary.csv')
+            with open(csv_path, 'w') as csv_file:
+                csv_file.write(
+                    'ticker,start_date,end_date,sector,num_bases,length_run,'
+                    'pct_gain,extra\n'
+                    'AAPL-1,3/1/2004,1/7/2008,Electronic Technology,9,201,'
+                    '1608.7,x\n'
+                    'AAPL-2,5/26/2009,tbd,Electronic Technology,6,176,'
+                    '437.5,x\n'
+                    'AMD-1,6/1/2016,Tbd,Electronic Technology,6,176,437.5,x\n'
+                    'NVDA-1,9/28/2015,10/8/2018,Electronic Technology,9,157,'
+                    '1109.0,x\n'
+                    'SQ-1,10/31/2016,,Technology Services,6,101,738.5,x\n'
+                )
+            chunks = list(self.command.iter_filtered_csv(
+                tmp_dir, 'stock_summary.csv', chunk_size=2))
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1, 0])
+        self.assertNotIn('extra', chunks[0].columns)
+        self.assertEqual(chunks[0]['sector'].dtype.name, 'category')
+        self.assertEqual(chunks[1].iloc[0]['end_date'],
+                         datetime.date(2018, 10, 8))
+
+    def test_add_stock_runs_in_bulk(self):
+        chunks = self.command.iter_filtered_csv(
+            DATA_DIR, TEST_RUNS, chunk_size=4)
+
+        total = sum(self.command.add_stocks_to_db(chunk, self.user)
+                    for chunk in chunks)
+
+        self.assertEqual(total, 9)
+        self.assertEqual(Stock.objects.filter(user=self.user).count(), 9)
+        stock = Stock.objects.get(ticker='AAPL-1')
+        self.assertEqual(stock.start_date, datetime.date(2004, 3, 1))
+        self.assertEqual(stock.pct_gain, Decimal('1608.7'))
+        self.assertEqual(stock.num_bases, 9)
+
+    def test_plain_import_counts_skipped_runs(self):
+        """Runs already in the database are reported unchanged, not written."""
+        chunk = next(self.command.iter_filtered_csv(DATA_DIR, TEST_RUNS))
+        self.command.write_stock_runs(
+            self.command.prepare_stock_runs(chunk.iloc[:4], self.user))
+
+        self.assertEqual(self.command.load_frame(chunk, self.user), (5, 0, 4))
+        self.assertEqual(self.command.load_frame(chunk, self.user), (0, 0, 9))
+        self.assertEqual(Stock.objects.filter(user=self.user).count(), 9)
+
+    def test_incremental_import_only_writes_changes(self):
+        """Rerunning an import only touches new and changed runs."""
+        chunk = next(self.command.iter_filtered_csv(DATA_DIR, TEST_RUNS))
+        upsert = self.command.upsert_stocks_to_db
+        self.assertEqual(upsert(chunk, self.user), (9, 0, 0))
+        self.assertEqual(upsert(chunk, self.user), (0, 0, 9))
+
+        changed = chunk.copy()
+        changed.loc[changed['ticker'] == 'AAPL-1', 'pct_gain'] = 1700.1
+        self.assertEqual(upsert(changed, self.user), (0, 1, 8))
+
+        self.assertEqual(Stock.objects.filter(user=self.user).count(), 9)
+        self.assertEqual(Stock.objects.get(ticker='AAPL-1').pct_gain,
+                         Decimal('1700.1'))
+        first_run = Stock.objects.filter(symbol='AAPL').order_by('run_number')
+        self.assertEqual(first_run.first().ticker, 'AAPL-1')
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_columnar_input_matches_csv(self):
+        """Parquet and Feather files are read by extension like the CSV."""
+        csv_chunks = list(
+            self.command.iter_filtered_csv(DATA_DIR, TEST_RUNS, 4))
+        source = pd.read_csv(os.path.join(DATA_DIR, TEST_RUNS))
+        source['start_date'] = pd.to_datetime(source['start_date']).dt.date
+        source['end_date'] = pd.to_datetime(source['end_date']).dt.date
+        source['notes'] = 'not needed'
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source.to_parquet(os.path.join(tmp_dir, 'runs.parquet'))
+            source.to_feather(os.path.join(tmp_dir, 'runs.feather'))
+
+            for file_name in ['runs.parquet', 'runs.feather']:
+                chunks = list(
+                    self.command.iter_filtered_csv(tmp_dir, file_name, 4))
+                self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 1])
+                self.assertNotIn('notes', chunks[0].columns)
+                self.assertEqual(chunks[0]['sector'].dtype.name, 'category')
+                for chunk, csv_chunk in zip(chunks, csv_chunks):
+                    for column in ['start_date', 'ticker']:
+                        self.assertEqual(chunk[column].tolist(),
+                                         csv_chunk[column].tolist())
+
+    def test_unsupported_input_file(self):
+        with self.assertRaises(CommandError):
+            next(self.command.iter_filtered_csv(
+                DATA_DIR, 'stock_summary.xlsx'))
+
+
+class BenchmarkIngestTests(TestCase):
+
+    def test_benchmark_reports_every_phase(self):
+        user = get_user_model().objects.create_user(
+            'benchmark@example.com', 'testpassword123')
+        command = benchmark_ingest.Command(stdout=StringIO())
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            command.generate_data(data_dir, runs=40, bases_per_run=3)
+            report = command.run_benchmark(data_dir, user, chunk_size=15)
+
+        runs = Stock.objects.filter(user=user).count()
+        self.assertGreater(runs, 30)
+        self.assertEqual(report['stock_runs']['total']['rows'], runs)
+        self.assertEqual(report['stock_bases']['total']['rows'],
+                         StockBase.objects.count())
+        self.assertEqual(StockBase.objects.count(), runs * 3)
+        for loader in report.values():
+            self.assertEqual(set(loader),
+                             {'parse', 'transform', 'write', 'total'})
+            self.assertGreater(loader['write']['queries'], 0)
+            self.assertGreater(loader['total']['peak_rss_mb'], 0)
+        # the commands' loaders ran, with their checkpoints
+        completed = ImportCheckpoint.objects.filter(completed=True)
+        self.assertEqual(
+            sorted(completed.values_list('name', flat=True)),
+            ['populate_stock_base_data_in_db',
+             'populate_stock_run_data_in_db'])
+
+
+class BenchmarkSerializationTests(TestCase):
+
+    def test_benchmark_compares_serializers(self):
+        user = get_user_model().objects.create_user(
+            'benchmark@example.com', 'testpassword123')
+        command = benchmark_serialization.Command(stdout=StringIO())
+
+        command.create_data(user, runs=20, bases_per_run=3)
+        report = command.run_benchmark(user, repeat=1)
+
+        self.assertEqual(Stock.objects.get(ticker='T00001-1').bases.count(), 3)
+        self.assertEqual(report['stocks']['drf']['rows'], 20)
+        self.assertEqual(report['stocks']['fast']['rows'], 20)
+        self.assertEqual(report['stockbases']['fast']['rows'], 60)
+        for endpoint in report.values():
+            self.assertGreater(endpoint['fast']['rows_per_sec'], 0)
+            self.assertIn('speedup', endpoint)
+
+
+class ExplainQueriesTests(TestCase):
+
+    def test_explains_every_hot_query(self):
+        user = get_user_model().objects.create_user(
+            'explain@example.com', 'testpassword123')
+        benchmark_serialization.Command().create_data(
+            user, runs=20, bases_per_run=3)
+        out = StringIO()
+
+        call_command('explain_queries', stdout=out)
+
+        output = out.getvalue()
+        for name in ['stock list', 'stock list bases', 'stock detail',
+                     'stock base list', 'stock bases by breakout date',
+                     'importer run lookup']:
+            self.assertIn(name + '\n', output)
+        self.assertIn('actual time', output)
+
+    def test_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command('explain_queries', email='nobody@example.com',
+                         stdout=StringIO())
@@ -0,0 +1,70 @@
+"""
+Tests for the data migrations.
+"""
+import datetime
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrate back to ``migrate_from``, load data, then run ``migrate_to``."""
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes('core')
+        executor.migrate([('core', self.migrate_from)])
+        self.old_apps = executor.loader.project_state(
+            [('core', self.migrate_from)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.latest)
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('core', self.migrate_to)])
+        return executor.loader.project_state([('core', self.migrate_to)]).apps
+
+
+class UniqueStockBaseMigrationTests(MigrationTestCase):
+    migrate_from = '0014_importcheckpoint'
+    migrate_to = '0015_stockbase_unique_stock_base'
+
+    def test_duplicate_bases_are_merged(self):
+        User = self.old_apps.get_model('core', 'User')
+        Stock = self.old_apps.get_model('core', 'Stock')
+        StockBase = self.old_apps.get_model('core', 'StockBase')
+        user = User.objects.create(email='migrate@example.com')
+        stocks = [
+            Stock.objects.create(
+                user=user, ticker=ticker,
+                start_date=datetime.date(2016, 10, 31),
+                end_date=datetime.date(2018, 10, 8), num_bases=1,
+                sector='Technology Services', length_run=101, pct_gain='738.5')
+            for ticker in ['SQ-1', 'SQ-2']
+        ]
+        bases = [
+            StockBase.objects.create(user=user, ticker='SQ-1', base_count=1,
+                                     bo_date=datetime.date(2017, 2, 21),
+                                     source_hash=source_hash)
+            for source_hash in ['', 'imported', '']
+        ]
+        stocks[0].bases.add(bases[0], bases[1])
+        stocks[1].bases.add(bases[2])
+
+        new_apps = self.migrate()
+
+        StockBase = new_apps.get_model('core', 'StockBase')
+        Stock = new_apps.get_model('core', 'Stock')
+        self.assertEqual(list(StockBase.objects.values_list('id', flat=True)),
+                         [bases[1].id])
+        for stock in stocks:
+            linked = Stock.objects.get(id=stock.id).bases
+            self.assertEqual(list(linked.values_list('id', flat=True)),
+                             [bases[1].id])
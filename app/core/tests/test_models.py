@@ -7,8 +7,10 @@ DJacobson 8/27/2022
 import pytz
 
 from decimal import Decimal
+from importlib import import_module
 import datetime
 
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -107,3 +109,92 @@ class ModelTests(TestCase):
         )
 
         self.assertEqual(stock, base.ticker)
+
+    def test_get_or_create_many_stock_bases(self):
+        """Bases are matched on their identity, existing ones are reused."""
+        user = create_user()
+        existing = models.StockBase.objects.create(
+            user=user,
+            ticker='SQ-1',
+            base_count=1,
+            bo_date=datetime.date(2016, 10, 31),
+        )
+        bases = [
+            {'ticker': 'SQ-1', 'base_count': 1,
+             'bo_date': datetime.date(2016, 10, 31)},
+            {'ticker': 'SQ-1', 'base_count': 2,
+             'bo_date': datetime.date(2017, 2, 21),
+             'bo_vol_ratio': Decimal('3.13')},
+            {'ticker': 'SQ-1', 'base_count': 2,
+             'bo_date': datetime.date(2017, 2, 21)},
+        ]
+
+        ids = models.StockBase.objects.get_or_create_many(user, bases)
+
+        self.assertEqual(len(ids), 2)
+        self.assertIn(existing.id, ids)
+        self.assertEqual(models.StockBase.objects.count(), 2)
+        created = models.StockBase.objects.get(base_count=2)
+        self.assertEqual(created.bo_vol_ratio, Decimal('3.13'))
+        self.assertEqual(
+            models.StockBase.objects.get_or_create_many(user, bases), ids)
+
+    def test_split_ticker(self):
+        self.assertEqual(models.split_ticker('aapl-2'), ('AAPL', 2))
+        self.assertEqual(models.split_ticker('BRK-B-12'), ('BRK-B', 12))
+        self.assertEqual(models.split_ticker('AAPL'), ('AAPL', None))
+        self.assertEqual(models.split_ticker('AAPL-'), ('AAPL-', None))
+
+    def test_stock_symbol_follows_ticker(self):
+        """Symbol and run number are kept in step on every write path."""
+        user = create_user()
+        fields = {
+            'user': user,
+            'start_date': datetime.date(2016, 10, 31),
+            'end_date': datetime.date(2018, 10, 8),
+            'num_bases': 1,
+            'sector': 'Technology Services',
+            'length_run': 101,
+            'pct_gain': Decimal('738.5'),
+        }
+        stock = models.Stock.objects.create(ticker='sq-1', **fields)
+        self.assertEqual((stock.symbol, stock.run_number), ('SQ', 1))
+
+        stock.ticker = 'SQ-2'
+        stock.save(update_fields=['ticker'])
+        created, = models.Stock.objects.bulk_create(
+            [models.Stock(ticker='AMD-3', **fields)])
+        created.ticker = 'AMD-4'
+        models.Stock.objects.bulk_update([created], ['ticker'])
+
+        self.assertEqual(
+            sorted(models.Stock.objects.values_list('symbol', 'run_number')),
+            [('AMD', 4), ('SQ', 2)],
+        )
+
+    def test_symbol_migration_matches_split_ticker(self):
+        """The data migration splits tickers like split_ticker does."""
+        migration = import_module(
+            'core.migrations.0020_stock_symbol_run_number')
+        split_sql = next(operation.sql
+                         for operation in migration.Migration.operations
+                         if hasattr(operation, 'sql'))
+        user = create_user()
+        tickers = ['aapl-2', 'BRK-B-12', 'AAPL', 'AAPL-', ' nvda-1 ', 'X-1-']
+        for ticker in tickers:
+            models.Stock.objects.create(
+                user=user, ticker=ticker,
+                start_date=datetime.date(2016, 10, 31),
+                end_date=datetime.date(2018, 10, 8), num_bases=1,
+                sector='Technology Services', length_run=101,
+                pct_gain=Decimal('738.5'))
+        models.Stock.objects.update(symbol='', run_number=None)
+
+        with connection.cursor() as cursor:
+            cursor.execute(split_sql)
+
+        rows = models.Stock.objects.values_list(
+            'ticker', 'symbol', 'run_number')
+        for ticker, symbol, run_number in rows:
+            self.assertEqual((symbol, run_number),
+                             models.split_ticker(ticker), ticker)
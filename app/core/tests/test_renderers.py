@@ -0,0 +1,102 @@
+"""
+Tests for the orjson renderer and parser.
+"""
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
+import datetime
+import uuid
+
+from django.test import SimpleTestCase, override_settings
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import parsers, renderers
+
+DATA = {
+    'ticker': 'AMD-1',
+    'pct_gain': Decimal('123.4'),
+    'start_date': datetime.date(2015, 10, 20),
+    'created': datetime.datetime(2022, 1, 2, 3, 4, 5,
+                                 tzinfo=datetime.timezone.utc),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'bases': [
+        {'bo_vol_ratio': Decimal('2.50'), 'vol_bo': 10 ** 12,
+         'base_failure': None},
+    ],
+    'notes': 'café',
+}
+
+
+@skipUnless(renderers.orjson, 'orjson is not installed')
+class FastJSONRendererTests(SimpleTestCase):
+
+    def test_render_matches_drf_renderer(self):
+        # Serializers have already turned decimals into strings.
+        bases = [{'bo_vol_ratio': '2.50', 'vol_bo': 10 ** 12,
+                  'base_failure': None}]
+        data = dict(DATA, created='2022-01-02T03:04:05Z', pct_gain='123.4',
+                    bases=bases)
+        self.assertEqual(renderers.FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_native_types(self):
+        content = renderers.FastJSONRenderer().render(DATA)
+
+        self.assertIn(b'"pct_gain":"123.4"', content)
+        self.assertIn(b'"start_date":"2015-10-20"', content)
+        self.assertIn(b'"created":"2022-01-02T03:04:05Z"', content)
+        self.assertIn(b'"id":"12345678-1234-5678-1234-567812345678"', content)
+
+    def test_decimals_as_numbers(self):
+        with override_settings(
+                REST_FRAMEWORK={'COERCE_DECIMAL_TO_STRING': False}):
+            content = renderers.FastJSONRenderer().render(DATA)
+
+        self.assertIn(b'"pct_gain":123.4', content)
+        self.assertIn(b'"bo_vol_ratio":2.5', content)
+
+    def test_indent_uses_drf_renderer(self):
+        content = renderers.FastJSONRenderer().render(
+            DATA, 'application/json; indent=4')
+        self.assertIn(b'\n    "ticker"', content)
+
+    def test_render_none(self):
+        self.assertEqual(renderers.FastJSONRenderer().render(None), b'')
+
+    def test_fallback_without_orjson(self):
+        data = dict(DATA, created='2022-01-02T03:04:05Z', pct_gain='123.4',
+                    bases=[])
+        with mock.patch.object(renderers, 'orjson', None):
+            content = renderers.FastJSONRenderer().render(data)
+        self.assertEqual(content, JSONRenderer().render(data))
+
+
+@skipUnless(parsers.orjson, 'orjson is not installed')
+class FastJSONParserTests(SimpleTestCase):
+
+    def parse(self, content, **context):
+        return parsers.FastJSONParser().parse(
+            BytesIO(content), 'application/json', context)
+
+    def test_parse_matches_drf_parser(self):
+        content = ('{"ticker":"AMD-1","pct_gain":123.4,'
+                   '"bases":[{"vol_bo":1}],"notes":"café"}').encode()
+        self.assertEqual(self.parse(content),
+                         JSONParser().parse(BytesIO(content)))
+
+    def test_parse_other_encoding(self):
+        content = '{"notes":"café"}'.encode('latin-1')
+        self.assertEqual(self.parse(content, encoding='latin-1'),
+                         {'notes': 'café'})
+
+    def test_invalid_json_raises_parse_error(self):
+        for content in [b'{"ticker":', b'{"pct_gain":NaN}']:
+            with self.assertRaises(ParseError):
+                self.parse(content)
+
+    def test_fallback_without_orjson(self):
+        with mock.patch.object(parsers, 'orjson', None):
+            self.assertEqual(self.parse(b'{"a":[1,2]}'), {'a': [1, 2]})
@@ -0,0 +1,66 @@
+"""
+Shared test helpers.
+"""
+from decimal import Decimal
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import (Stock, StockBase)
+
+
+def create_stock_with_bases(user, ticker, num_bases):
+    """Create a stock run linked to ``num_bases`` bases of its own."""
+    stock = Stock.objects.create(
+        user=user,
+        ticker=ticker,
+        start_date=datetime.date(2015, 10, 20),
+        end_date=datetime.date(2017, 10, 20),
+        num_bases=num_bases,
+        sector='Electronic Technology',
+        length_run=90,
+        pct_gain=Decimal('123.4'),
+    )
+    bases = StockBase.objects.bulk_create([
+        StockBase(
+            user=user, stock_reference=stock, ticker=ticker,
+            base_count=count,
+            bo_date=datetime.date(2016, 1, 1) + datetime.timedelta(days=count),
+            bo_vol_ratio=Decimal('2.50'), vol_bo=1000 + count,
+        )
+        for count in range(num_bases)
+    ])
+    stock.bases.add(*bases)
+    return stock
+
+
+class QueryBudgetMixin:
+    """Assert how many queries an API endpoint may issue.
+
+    Mix into a TestCase which has an APIClient as ``self.client``.
+    """
+
+    def assertQueryBudget(self, budget, url, method='get', data=None, **extra):
+        """Request ``url`` and fail if it issues more than ``budget`` queries.
+
+        Args:
+            budget (int): maximum number of queries
+            url (str): endpoint to request
+            method (str): HTTP method of the client
+            data (dict): query params or request body
+            extra: passed on to the client, e.g. format='json'
+
+        Returns:
+            Response: response of the request
+        """
+        with CaptureQueriesContext(connection) as queries:
+            res = getattr(self.client, method)(url, data, **extra)
+        executed = [query['sql'] for query in queries.captured_queries]
+        self.assertLessEqual(
+            len(executed), budget,
+            '{} {} issued {} queries, budget is {}:\n{}'.format(
+                method.upper(), url, len(executed), budget,
+                '\n'.join(executed)),
+        )
+        return res
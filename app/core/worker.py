@@ -0,0 +1,15 @@
+'''
+Bootstrap of the processes loading import shards.
+
+Kept free of model imports so a freshly spawned process can unpickle the
+initializer before Django is set up.
+'''
+import django
+from django.db import connections
+
+
+def init_worker(database_names):
+    """Start Django in a worker process, on the parent's databases."""
+    django.setup()
+    for alias, name in database_names.items():
+        connections[alias].settings_dict['NAME'] = name
@@ -0,0 +1,181 @@
+"""
+Batch create / update of a user's stock runs with their nested bases.
+
+Every item is validated by StockDetailSerializer first, then all valid
+items are written with a fixed number of set-based statements, whatever
+the number of runs and bases in the batch.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from rest_framework import serializers as drf_serializers
+
+from core.models import (Stock, StockBase)
+from stock.serializers import StockDetailSerializer
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+INVALID = 'invalid'
+NOT_FOUND = 'not_found'
+
+
+class BulkItem:
+    """One item of a batch and what became of it."""
+
+    def __init__(self, data, instance=None):
+        self.data = data
+        self.instance = instance
+        self.validated_data = None
+        self.status = None
+        self.errors = None
+
+    def result(self):
+        if self.errors is not None:
+            return {'status': self.status, 'errors': self.errors}
+        return {'status': self.status, 'id': self.instance.id}
+
+
+def validate_items(data, user, context):
+    """Validate a batch, fetching the runs to update with one query.
+
+    Items with an ``id`` replace that run of the user, like a PUT, the
+    others create a run, like a POST.
+
+    Args:
+        data (list): request body
+        user (User): owner of the runs
+        context (dict): serializer context
+
+    Returns:
+        list: BulkItem per item, in request order
+    """
+    if not isinstance(data, list):
+        raise drf_serializers.ValidationError({
+            'non_field_errors': ['Expected a list of stock runs.'],
+        })
+    if len(data) > settings.STOCK_API_MAX_BULK_SIZE:
+        raise drf_serializers.ValidationError({'non_field_errors': [
+            'At most {} stock runs per request.'.format(
+                settings.STOCK_API_MAX_BULK_SIZE)]})
+
+    ids = [entry.get('id') for entry in data if isinstance(entry, dict)]
+    ids = [stock_id for stock_id in ids if isinstance(stock_id, int)]
+    existing = Stock.objects.filter(user=user).in_bulk(ids) if ids else {}
+
+    items = []
+    for entry in data:
+        item = BulkItem(entry)
+        items.append(item)
+        if not isinstance(entry, dict):
+            item.status = INVALID
+            item.errors = {
+                'non_field_errors': ['Expected a stock run object.']}
+            continue
+        if entry.get('id') is not None:
+            item.instance = existing.get(entry['id'])
+            if item.instance is None:
+                item.status = NOT_FOUND
+                item.errors = {'id': ['Stock run not found.']}
+                continue
+        serializer = StockDetailSerializer(
+            item.instance, data=entry, context=context)
+        if serializer.is_valid():
+            item.validated_data = dict(serializer.validated_data)
+        else:
+            item.status, item.errors = INVALID, serializer.errors
+    return items
+
+
+@transaction.atomic
+def save_items(items, user):
+    """Write the valid items of a batch in one transaction.
+
+    Bases of all items are created or updated with one upsert, new runs
+    inserted with one INSERT, changed runs written with one UPDATE, and
+    links diffed with one read, one DELETE and one INSERT.
+
+    Args:
+        items (list): validated BulkItems
+        user (User): owner of the runs
+
+    Returns:
+        bool: whether anything was written
+    """
+    valid = [item for item in items if item.validated_data is not None]
+    bases = [base for item in valid
+             for base in item.validated_data.get('bases') or ()]
+    base_ids, written = StockBase.objects.resolve_many(user, bases)
+
+    wanted_links = {}
+    to_create, to_update, update_fields = [], [], set()
+    for item in valid:
+        bases = item.validated_data.pop('bases', None)
+        if item.instance is None:
+            item.instance = Stock(user=user, **item.validated_data)
+            item.status = CREATED
+            to_create.append(item)
+            bases = bases or []
+        else:
+            changed = [attr for attr, value in item.validated_data.items()
+                       if getattr(item.instance, attr) != value]
+            for attr in changed:
+                setattr(item.instance, attr, item.validated_data[attr])
+            if changed:
+                to_update.append(item.instance)
+                update_fields.update(changed)
+            item.status = UPDATED if changed else UNCHANGED
+        if bases is not None:
+            wanted_links[item] = {
+                base_ids[StockBase.objects.identity(base)] for base in bases}
+            if item.status == UNCHANGED and written & wanted_links[item]:
+                item.status = UPDATED
+
+    if to_create:
+        Stock.objects.bulk_create([item.instance for item in to_create])
+    if to_update:
+        Stock.objects.bulk_update(to_update, sorted(update_fields))
+
+    links_changed = set_links(wanted_links)
+    for item in links_changed:
+        if item.status == UNCHANGED:
+            item.status = UPDATED
+    return bool(to_create or to_update or links_changed or written)
+
+
+def set_links(wanted_links):
+    """Link exactly the wanted bases to each run, writing the difference.
+
+    Args:
+        wanted_links (dict): {BulkItem: set of base ids}
+
+    Returns:
+        set: items whose links changed
+    """
+    through = Stock.bases.through
+    current = {}
+    updated = [item.instance.id for item in wanted_links
+               if item.status != CREATED]
+    if updated:
+        links = (through.objects.filter(stock_id__in=updated)
+                 .values_list('id', 'stock_id', 'stockbase_id'))
+        for link_id, stock_id, base_id in links:
+            current.setdefault(stock_id, {})[base_id] = link_id
+
+    removed, added, changed = [], [], set()
+    for item, wanted in wanted_links.items():
+        links = current.get(item.instance.id, {})
+        stale = [link_id for base_id, link_id in links.items()
+                 if base_id not in wanted]
+        new = sorted(wanted - links.keys())
+        removed.extend(stale)
+        added.extend(through(stock_id=item.instance.id, stockbase_id=base_id)
+                     for base_id in new)
+        if stale or new:
+            changed.add(item)
+
+    if removed:
+        through.objects.filter(id__in=removed).delete()
+    if added:
+        through.objects.bulk_create(added, ignore_conflicts=True)
+    return changed
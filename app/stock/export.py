@@ -0,0 +1,155 @@
+"""
+Bulk export of a user's stock runs and bases.
+
+Rows are read straight from the database in chunks, without serializers,
+so memory stays bounded whatever the size of the export.
+"""
+import csv
+import io
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from rest_framework.exceptions import NotAcceptable
+
+from core.models import (Stock, StockBase)
+
+CHUNK_SIZE = 2000
+
+STOCK_FIELDS = [
+    'id', 'ticker', 'symbol', 'run_number', 'start_date', 'end_date', 'sector',
+    'num_bases', 'length_run', 'pct_gain', 'stock_run_notes',
+]
+BASE_FIELDS = [
+    'id', 'ticker', 'base_count', 'base_failure', 'bo_date', 'vol_bo',
+    'vol_20', 'bo_vol_ratio', 'price_percent_range', 'base_length',
+    'sales_0qtr',
+]
+
+# Tables offered as CSV / Parquet downloads: model and columns.
+FILE_EXPORTS = {
+    'stocks': (Stock, STOCK_FIELDS),
+    'stockbases': (StockBase, BASE_FIELDS + ['stock_reference']),
+}
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items of an iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_stocks_with_bases(user, chunk_size=CHUNK_SIZE):
+    """Stream a user's stocks with their bases nested, in id order.
+
+    Stocks come from a server-side cursor, the bases of every chunk of
+    stocks are read with one more query.
+
+    Args:
+        user (User): owner of the stocks
+        chunk_size (int): stocks read per round trip
+
+    Yields:
+        dict: stock field values with a ``bases`` list
+    """
+    stocks = (Stock.objects
+              .filter(user=user)
+              .order_by('id')
+              .values(*STOCK_FIELDS)
+              .iterator(chunk_size=chunk_size))
+    link = Stock.bases.through
+    for chunk in chunked(stocks, chunk_size):
+        bases = {stock['id']: [] for stock in chunk}
+        links = (link.objects
+                 .filter(stock_id__in=bases)
+                 .order_by('stock_id', 'stockbase_id')
+                 .values_list('stock_id', *('stockbase__' + field
+                                            for field in BASE_FIELDS)))
+        for stock_id, *values in links:
+            bases[stock_id].append(dict(zip(BASE_FIELDS, values)))
+        for stock in chunk:
+            stock['bases'] = bases[stock['id']]
+            yield stock
+
+
+def iter_ndjson(rows):
+    """Encode rows as newline delimited JSON, the way the API renders them."""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def iter_value_chunks(queryset, fields, chunk_size=CHUNK_SIZE):
+    """Yield lists of value tuples, read from a server-side cursor."""
+    rows = (queryset.order_by('id').values_list(*fields)
+            .iterator(chunk_size=chunk_size))
+    return chunked(rows, chunk_size)
+
+
+def iter_csv(fields, chunks):
+    """Encode chunks of value tuples as CSV, one string per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise NotAcceptable('pyarrow is required for Parquet exports.')
+    return pyarrow
+
+
+def arrow_schema(model, fields):
+    """Arrow schema matching the columns of a model."""
+    pa = _import_pyarrow()
+    columns = []
+    for name in fields:
+        field = model._meta.get_field(name)
+        if isinstance(field, models.DecimalField):
+            arrow_type = pa.decimal128(field.max_digits, field.decimal_places)
+        elif isinstance(field, models.DateField):
+            arrow_type = pa.date32()
+        elif isinstance(field, (models.BigIntegerField, models.AutoField,
+                                models.ForeignKey)):
+            arrow_type = pa.int64()
+        elif isinstance(field, models.IntegerField):
+            arrow_type = pa.int32()
+        else:
+            arrow_type = pa.string()
+        columns.append(pa.field(name, arrow_type, nullable=field.null))
+    return pa.schema(columns)
+
+
+def write_parquet(model, fields, chunks, target):
+    """Write chunks of value tuples to a Parquet file, one row group each.
+
+    Args:
+        model (Model): model the values belong to
+        fields (list): column names, in value order
+        chunks (iterable): lists of value tuples
+        target (file): binary file object to write to
+    """
+    pa = _import_pyarrow()
+    schema = arrow_schema(model, fields)
+    with pa.parquet.ParquetWriter(target, schema) as writer:
+        for chunk in chunks:
+            columns = zip(*chunk)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type)
+                 for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
@@ -0,0 +1,142 @@
+"""
+Read-only list serialization straight from .values() rows.
+
+Produces the same JSON as the stock serializers, with the per-field work
+of DRF replaced by converters compiled once per serializer and field set.
+"""
+import decimal
+from functools import lru_cache
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from core.models import Stock
+
+
+def _identity(value):
+    return value
+
+
+def compile_converter(field):
+    """Build a function rendering a non-null DB value like ``field`` does.
+
+    Args:
+        field (Field): serializer field
+
+    Returns:
+        callable: value -> representation
+    """
+    if isinstance(field, serializers.DecimalField):
+        if field.decimal_places is None or field.localize:
+            return field.to_representation
+        quantum = decimal.Decimal('.1') ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        rounding = field.rounding
+
+        def quantize(value):
+            return value.quantize(quantum, rounding=rounding, context=context)
+        if not getattr(field, 'coerce_to_string',
+                       api_settings.COERCE_DECIMAL_TO_STRING):
+            return quantize
+        return lambda value: '{:f}'.format(quantize(value))
+    if isinstance(field, serializers.DateField):
+        output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+        if output_format is None:
+            return _identity
+        if output_format.lower() == ISO_8601:
+            return lambda value: value.isoformat()
+        return lambda value: value.strftime(output_format)
+    if isinstance(field, (serializers.IntegerField, serializers.CharField)):
+        # The database driver already returns ints and strs.
+        return _identity
+    return field.to_representation
+
+
+class FastListSerializer:
+    """Serialize .values() rows with the JSON shape of a ModelSerializer.
+
+    Only plain model fields and the nested ``bases`` list of a stock are
+    supported, which is what the stock serializers have.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        serializer_fields = serializer_class().fields
+        self.names = list(
+            fields if fields is not None else serializer_fields)
+        self.nested = None
+        self.converters = []
+        for name in self.names:
+            field = serializer_fields[name]
+            if isinstance(field, serializers.ListSerializer):
+                self.nested = name
+                self.base_serializer = get_fast_serializer(
+                    field.child.__class__)
+                self.converters.append((name, None))
+            else:
+                self.converters.append((name, compile_converter(field)))
+        self.columns = [name for name in self.names if name != self.nested]
+
+    def to_representation(self, rows, bases=None):
+        """Render rows fetched with .values(), including self.columns.
+
+        Args:
+            rows (iterable): dicts of column values
+            bases (dict): {stock id: list of base rows} when bases are nested
+
+        Returns:
+            list: one dict per row
+        """
+        data = []
+        for row in rows:
+            item = {}
+            for name, convert in self.converters:
+                if convert is None:
+                    item[name] = self.base_serializer.to_representation(
+                        bases.get(row['id'], ()))
+                    continue
+                value = row[name]
+                item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+
+    def fetch_bases(self, stock_ids):
+        """Read the bases of some stocks with one query.
+
+        Returns:
+            dict: {stock id: list of base rows}
+        """
+        columns = self.base_serializer.columns
+        rows = (Stock.bases.through.objects
+                .filter(stock_id__in=stock_ids)
+                .order_by('stock_id', 'stockbase_id')
+                .values_list('stock_id', *('stockbase__' + column
+                                           for column in columns)))
+        bases = {}
+        for stock_id, *values in rows:
+            bases.setdefault(stock_id, []).append(dict(zip(columns, values)))
+        return bases
+
+    def serialize(self, rows):
+        """Render rows, fetching the nested bases when needed.
+
+        Rows need an ``id`` column when bases are nested.
+        """
+        rows = list(rows)
+        bases = None
+        if self.nested:
+            bases = self.fetch_bases([row['id'] for row in rows])
+        return self.to_representation(rows, bases)
+
+
+@lru_cache(maxsize=None)
+def _cached_serializer(serializer_class, fields):
+    return FastListSerializer(serializer_class, fields)
+
+
+def get_fast_serializer(serializer_class, fields=None):
+    """Fast serializer of a serializer class and field set, compiled once."""
+    if fields is not None:
+        fields = tuple(fields)
+    return _cached_serializer(serializer_class, fields)
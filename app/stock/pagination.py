@@ -0,0 +1,41 @@
+"""
+Cursor pagination of the stock API.
+"""
+from django.conf import settings
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+
+class StockCursorPagination(CursorPagination):
+    """Keyset pagination, deep pages cost the same as the first one.
+
+    Lists are paginated once a client sends ``cursor`` or ``page_size``,
+    without either the full list is returned as before. The cursor follows
+    the ?ordering= of the view, which must start with a non null column.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.STOCK_API_PAGE_SIZE
+        self.max_page_size = settings.STOCK_API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (self.cursor_query_param not in params
+                and self.page_size_query_param not in params):
+            return None
+        position = self.get_ordering(request, queryset, view)[0].lstrip('-')
+        if queryset.model._meta.get_field(position).null:
+            # the cursor can not point past a NULL
+            raise ValidationError({
+                'ordering': 'Pages can not be ordered by {}, '
+                            'it may be empty.'.format(position),
+            })
+        return super().paginate_queryset(queryset, request, view)
+
+
+class StockBaseCursorPagination(StockCursorPagination):
+    """Stock bases are paged by ticker, id breaks the ties."""
+    ordering = ('ticker', 'id')
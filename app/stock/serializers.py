@@ -1,9 +1,59 @@
 from importlib.metadata import requires
+from django.db import transaction
 from rest_framework import serializers, fields
+from rest_framework.permissions import SAFE_METHODS
 
 from core.models import(Stock, StockBase)
 
-class StockBaseSerializer(serializers.ModelSerializer):
+
+def _split_param(params, name):
+    return [field for field in params.get(name, '').split(',') if field]
+
+
+def selected_fields(request, available):
+    """Fields picked by ?fields= and ?exclude= on a read request.
+
+    Args:
+        request (Request): current request, may be None
+        available (list): fields of the serializer
+
+    Returns:
+        list: selected fields in serializer order, None when all are wanted
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = request.query_params
+    if 'fields' not in params and 'exclude' not in params:
+        return None
+
+    requested = _split_param(params, 'fields') or list(available)
+    excluded = set(_split_param(params, 'exclude'))
+    unknown = (set(requested) | excluded) - set(available)
+    if unknown:
+        raise serializers.ValidationError({
+            'fields': 'Unknown fields: {}'.format(', '.join(sorted(unknown))),
+        })
+    return [field for field in available
+            if field in requested and field not in excluded]
+
+
+class FieldSelectionMixin:
+    """Serialize only the fields a read request asks for.
+
+    Only the top level serializer of a request is trimmed, nested
+    serializers have no request in their context when they are built.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = selected_fields(
+            self.context.get('request'), list(self.fields))
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class StockBaseSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     """Serializer for a stock base object.
 
     Args:
@@ -20,7 +70,38 @@ class StockBaseSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
 
-class StockSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        """Refuse an update giving the base the identity of another base.
+
+        Bases are unique on (user, ticker, base_count, bo_date) and imported
+        ones on (stock_reference, base_count). Only a base updated through
+        its own endpoint is checked, nested bases of a stock are matched on
+        their identity instead.
+        """
+        attrs = super().validate(attrs)
+        base = self.instance
+        if base is None or self.parent is not None:
+            return attrs
+
+        identity = {name: attrs.get(name, getattr(base, name))
+                    for name in ['ticker', 'base_count', 'bo_date']}
+        others = StockBase.objects.exclude(pk=base.pk)
+        if others.filter(user=base.user_id, **identity).exists():
+            raise serializers.ValidationError(
+                'A stock base with this ticker, base_count and bo_date '
+                'already exists.')
+        if base.source_hash and base.stock_reference_id and others.filter(
+                stock_reference=base.stock_reference_id,
+                base_count=identity['base_count'],
+        ).exclude(source_hash='').exists():
+            raise serializers.ValidationError({
+                'base_count': 'The stock run already has an imported base '
+                              'with this base_count.',
+            })
+        return attrs
+
+
+class StockSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     """Serializer for a stock
 
     Args:
@@ -34,10 +115,10 @@ class StockSerializer(serializers.ModelSerializer):
     class Meta:
         model = Stock
         fields = [
-            'id', 'ticker', 'start_date', 'end_date', 'sector',
-            'num_bases', 'length_run', 'pct_gain', 'bases'
+            'id', 'ticker', 'symbol', 'run_number', 'start_date', 'end_date',
+            'sector', 'num_bases', 'length_run', 'pct_gain', 'bases'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['id', 'symbol', 'run_number']
 
 class StockDetailSerializer(StockSerializer):
     """Serializer for stock run detail view
@@ -45,39 +126,86 @@ class StockDetailSerializer(StockSerializer):
     Args:
         StockSerializer (_type_): _description_
     """
+    bases_written = False
+
     class Meta(StockSerializer.Meta):
         fields = StockSerializer.Meta.fields + ['stock_run_notes']
 
-    def _get_or_create_stock_bases(self, bases, stock):
-        """Fetch or create stock bases
+    def _get_or_create_stock_bases(self, bases):
+        """Fetch, create or update stock bases.
+
+        Bases are matched on their identity (user, ticker, base_count,
+        bo_date), existing ones are looked up in one query and the missing
+        or changed ones written with a single upsert. Concurrent requests
+        can not create duplicates and the number of queries does not grow
+        with the bases.
 
         Args:
-            bases (_type_): _description_
-            stock (_type_): _description_
+            bases (list): validated stock base data
+
+        Returns:
+            list: ids of the stock bases
         """
         auth_user = self.context['request'].user
-        for base in bases:
-            base_obj, created = StockBase.objects.get_or_create(
-                user=auth_user,
-                **base,
+        ids, written = StockBase.objects.resolve_many(auth_user, bases)
+        self.bases_written = self.bases_written or bool(written)
+        return sorted(set(ids.values()))
+
+    def _set_stock_bases(self, stock, base_ids, created=False):
+        """Link exactly these bases to the stock, writing only the difference.
+
+        Args:
+            stock (Stock): stock run
+            base_ids (list): ids of the stock bases to link
+            created (bool): the stock is new and has no links yet
+
+        Returns:
+            bool: whether any link was added or removed
+        """
+        through = Stock.bases.through
+        current = set() if created else set(
+            through.objects.filter(stock=stock)
+            .values_list('stockbase_id', flat=True)
+        )
+        wanted = set(base_ids)
+
+        removed = current - wanted
+        if removed:
+            through.objects.filter(
+                stock=stock, stockbase_id__in=removed).delete()
+        added = wanted - current
+        if added:
+            through.objects.bulk_create(
+                [through(stock=stock, stockbase_id=base_id)
+                 for base_id in sorted(added)],
+                ignore_conflicts=True,
             )
-            stock.bases.add(base_obj)
+        return bool(removed or added)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Create a stock."""
         bases = validated_data.pop('bases', [])
         stock = Stock.objects.create(**validated_data)
-        self._get_or_create_stock_bases(bases, stock)
+        self._set_stock_bases(
+            stock, self._get_or_create_stock_bases(bases), created=True)
         return stock
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Update stock."""
+        """Update stock, saving only the fields which changed."""
         bases = validated_data.pop('bases', None)
+        links_changed = False
         if bases is not None:
-            instance.bases.clear()
-            self._get_or_create_stock_bases(bases, instance)
+            links_changed = self._set_stock_bases(
+                instance, self._get_or_create_stock_bases(bases))
 
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        changed = [attr for attr, value in validated_data.items()
+                   if getattr(instance, attr) != value]
+        for attr in changed:
+            setattr(instance, attr, validated_data[attr])
+        if changed:
+            instance.save(update_fields=changed)
+        # read by the viewset to leave the data version alone on a no-op
+        self.changed = links_changed or bool(changed) or self.bases_written
         return instance
@@ -0,0 +1,157 @@
+"""
+Tests for the bulk stock run endpoint.
+"""
+from decimal import Decimal
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (DataVersion, Stock, StockBase)
+
+BULK_URL = reverse('stock:stock-bulk')
+
+
+def run_payload(ticker, num_bases=0, **params):
+    payload = {
+        'ticker': ticker,
+        'start_date': '2016-10-31',
+        'end_date': '2018-10-08',
+        'sector': 'Technology Services',
+        'num_bases': num_bases,
+        'length_run': 101,
+        'pct_gain': '738.5',
+        'bases': [{
+            'ticker': ticker,
+            'base_count': count,
+            'bo_date': '2017-02-21',
+        } for count in range(num_bases)],
+    }
+    payload.update(params)
+    return payload
+
+
+class BulkStockAPITests(TestCase):
+    """Batch create / update of stock runs."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='bulk@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+
+    def create_stock(self, user, ticker):
+        return Stock.objects.create(
+            user=user, ticker=ticker, start_date=datetime.date(2016, 10, 31),
+            end_date=datetime.date(2018, 10, 8), num_bases=0,
+            sector='Technology Services', length_run=101,
+            pct_gain=Decimal('738.5'))
+
+    def test_create_and_update_with_per_item_results(self):
+        stock = self.create_stock(self.user, 'SQ-1')
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com', password='pass12345')
+        other = self.create_stock(other_user, 'SQ-9')
+        payload = [
+            run_payload('AMD-1', 2),
+            run_payload('SQ-1', 1, id=stock.id, pct_gain='12.5'),
+            run_payload('NVDA-1', pct_gain='not a number'),
+            run_payload('SQ-9', id=other.id),
+            'not an object',
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'updated', 'invalid', 'not_found',
+                          'invalid'])
+        created = Stock.objects.get(id=results[0]['id'])
+        self.assertEqual(created.user, self.user)
+        self.assertEqual(created.bases.count(), 2)
+        self.assertEqual(results[1]['id'], stock.id)
+        stock.refresh_from_db()
+        self.assertEqual(stock.pct_gain, Decimal('12.5'))
+        self.assertEqual(stock.bases.count(), 1)
+        self.assertIn('pct_gain', results[2]['errors'])
+        self.assertFalse(Stock.objects.filter(ticker='NVDA-1').exists())
+        other.refresh_from_db()
+        self.assertEqual(other.user.email, 'other@example.com')
+        self.assertEqual(DataVersion.objects.current(self.user)[0], 1)
+
+    def test_shared_bases_created_once(self):
+        """Runs of a batch naming the same base share one stock base."""
+        payload = [run_payload('AMD-1', 2), run_payload('AMD-1', 3)]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(StockBase.objects.filter(user=self.user).count(), 3)
+        first, second = [Stock.objects.get(id=result['id'])
+                         for result in res.data['results']]
+        self.assertEqual(set(first.bases.all()) - set(second.bases.all()),
+                         set())
+
+    def test_unchanged_batch_writes_nothing(self):
+        res = self.client.post(BULK_URL, [run_payload('AMD-1', 2)],
+                               format='json')
+        payload = [run_payload('AMD-1', 2, id=res.data['results'][0]['id'])]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.data['results'][0]['status'], 'unchanged')
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+        self.assertEqual(DataVersion.objects.current(self.user)[0], 1)
+
+    def test_changed_base_values_are_written(self):
+        res = self.client.post(BULK_URL, [run_payload('AMD-1', 1)],
+                               format='json')
+        payload = run_payload('AMD-1', 1, id=res.data['results'][0]['id'])
+        payload['bases'][0]['vol_bo'] = 999
+
+        res = self.client.post(BULK_URL, [payload], format='json')
+
+        self.assertEqual(res.data['results'][0]['status'], 'updated')
+        self.assertEqual(StockBase.objects.get(user=self.user).vol_bo, 999)
+        self.assertEqual(DataVersion.objects.current(self.user)[0], 2)
+
+    def test_constant_queries(self):
+        """The number of queries grows with neither the runs nor the bases."""
+        def post(tickers, num_bases):
+            existing = [self.create_stock(self.user, ticker + '-OLD')
+                        for ticker in tickers]
+            payload = [run_payload(ticker, num_bases) for ticker in tickers]
+            payload += [run_payload(stock.ticker, num_bases, id=stock.id)
+                        for stock in existing]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(BULK_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        many = ['T-{}'.format(run) for run in range(20)]
+        self.assertEqual(post(['SQ-1', 'SQ-2'], 1), post(many, 10))
+        self.assertEqual(Stock.objects.get(ticker='T-19-OLD').bases.count(),
+                         10)
+
+    def test_body_must_be_a_list(self):
+        res = self.client.post(BULK_URL, run_payload('AMD-1'), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(STOCK_API_MAX_BULK_SIZE=2)
+    def test_batch_size_is_capped(self):
+        res = self.client.post(BULK_URL, [run_payload('AMD-1')] * 3,
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Stock.objects.exists())
@@ -0,0 +1,197 @@
+"""
+Tests for conditional GET and the response cache of the stock endpoints.
+"""
+from decimal import Decimal
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (DataVersion, Stock, StockBase)
+
+STOCKS_URL = reverse('stock:stock-list')
+STOCK_BASES_URL = reverse('stock:stockbase-list')
+
+cache = caches[settings.STOCK_API_CACHE]
+
+
+def create_stock(user, ticker='AMD-1'):
+    return Stock.objects.create(
+        user=user,
+        ticker=ticker,
+        start_date=datetime.date(2015, 10, 20),
+        end_date=datetime.date(2017, 10, 20),
+        num_bases=4,
+        sector='Electronic Technology',
+        length_run=90,
+        pct_gain=Decimal('123.4'),
+    )
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='etag@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+        self.stock = create_stock(self.user)
+
+    def test_not_modified_without_reading_stocks(self):
+        res = self.client.get(STOCKS_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(STOCKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_detail_not_modified(self):
+        url = reverse('stock:stock-detail', args=[self.stock.id])
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_differs_per_url(self):
+        etag = self.client.get(STOCKS_URL)['ETag']
+
+        res = self.client.get(STOCKS_URL, {'fields': 'ticker'},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_writes_bump_the_version(self):
+        etag = self.client.get(STOCKS_URL)['ETag']
+        url = reverse('stock:stock-detail', args=[self.stock.id])
+
+        self.client.patch(url, {'length_run': 91}, format='json')
+        res = self.client.get(STOCKS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['length_run'], 91)
+        etag = res['ETag']
+
+        self.client.delete(url)
+        res = self.client.get(STOCKS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+        self.assertEqual(DataVersion.objects.current(self.user)[0], 2)
+
+    def test_stock_base_writes_bump_the_version(self):
+        base = StockBase.objects.create(user=self.user, ticker='AMD-1',
+                                        base_count=1,
+                                        bo_date=datetime.date(2016, 1, 4))
+        etag = self.client.get(STOCK_BASES_URL)['ETag']
+
+        self.client.patch(reverse('stock:stockbase-detail', args=[base.id]),
+                          {'base_count': 2})
+        res = self.client.get(STOCK_BASES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['base_count'], 2)
+
+    def test_failed_write_keeps_the_version(self):
+        self.client.post(STOCKS_URL, {'ticker': 'AMD-2'}, format='json')
+
+        self.assertEqual(DataVersion.objects.current(self.user), (0, None))
+
+    def test_versions_are_per_user(self):
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='pass12345')
+        etag = self.client.get(STOCKS_URL)['ETag']
+
+        DataVersion.objects.bump(other)
+        res = self.client.get(STOCKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='cache@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+        self.stock = create_stock(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        first = self.client.get(STOCKS_URL)
+
+        with self.assertNumQueries(1):
+            second = self.client.get(STOCKS_URL)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_cache_keyed_by_params_and_user(self):
+        self.client.get(STOCKS_URL)
+
+        res = self.client.get(STOCKS_URL, {'fields': 'ticker'})
+        self.assertEqual(list(res.data[0]), ['ticker'])
+
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='pass12345')
+        self.client.force_authenticate(other)
+        res = self.client.get(STOCKS_URL)
+        self.assertEqual(res.data, [])
+
+    def test_writes_invalidate_the_cache(self):
+        self.client.get(STOCKS_URL)
+        url = reverse('stock:stock-detail', args=[self.stock.id])
+        self.client.get(url)
+
+        self.client.patch(url, {'ticker': 'AMD-2'}, format='json')
+
+        self.assertEqual(self.client.get(STOCKS_URL).data[0]['ticker'],
+                         'AMD-2')
+        self.assertEqual(self.client.get(url).data['ticker'], 'AMD-2')
+
+        self.client.post(STOCKS_URL, {
+            'ticker': 'NVDA-1', 'start_date': '2016-10-31',
+            'end_date': '2018-10-08', 'sector': 'Electronic Technology',
+            'num_bases': 1, 'length_run': 10, 'pct_gain': '1.5',
+        }, format='json')
+        self.assertEqual(len(self.client.get(STOCKS_URL).data), 2)
+
+    def test_imports_invalidate_the_cache(self):
+        self.client.get(STOCKS_URL)
+        create_stock(self.user, ticker='NVDA-1')
+
+        DataVersion.objects.bump(self.user)
+
+        self.assertEqual(len(self.client.get(STOCKS_URL).data), 2)
+
+    def test_large_responses_are_not_cached(self):
+        for ticker in ['NVDA-1', 'TSLA-1', 'SQ-1']:
+            create_stock(self.user, ticker=ticker)
+
+        with override_settings(STOCK_API_CACHE_MAX_ITEM_BYTES=400):
+            self.client.get(STOCKS_URL, {'page_size': 1})
+            self.client.get(STOCKS_URL)
+
+            with self.assertNumQueries(1):
+                self.client.get(STOCKS_URL, {'page_size': 1})
+            with self.assertNumQueries(3):
+                res = self.client.get(STOCKS_URL)
+
+        self.assertEqual(len(res.data), 4)
+
+    def test_errors_are_not_cached(self):
+        url = reverse('stock:stock-detail', args=[self.stock.id + 1000])
+        self.assertEqual(self.client.get(url).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        Stock.objects.filter(id=self.stock.id).update(id=self.stock.id + 1000)
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
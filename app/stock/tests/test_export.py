@@ -0,0 +1,140 @@
+"""
+Tests for the bulk export endpoints.
+"""
+from decimal import Decimal
+from unittest import skipUnless
+import csv
+import datetime
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.tests.utils import create_stock_with_bases
+
+from stock import export
+from stock.serializers import StockDetailSerializer
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_URL = reverse('stock:export')
+
+
+def export_file_url(dataset, file_format):
+    return reverse('stock:export-file', args=[dataset, file_format])
+
+
+class PublicExportApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        res = self.client.get(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateNdjsonExportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='export@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+
+    def test_ndjson_export_matches_detail_serializer(self):
+        """Every line is one stock of the user, shaped like the detail view."""
+        stocks = [create_stock_with_bases(self.user, 'AMD-{}'.format(run), run)
+                  for run in range(3)]
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='pass12345')
+        create_stock_with_bases(other, 'NVDA-1', 2)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        for line, stock in zip(lines, stocks):
+            expected = json.loads(
+                json.dumps(StockDetailSerializer(stock).data))
+            self.assertEqual(json.loads(line), expected)
+
+    def test_bases_joined_per_chunk(self):
+        """Bases are read with one query per chunk of stocks."""
+        for run in range(5):
+            create_stock_with_bases(self.user, 'AMD-{}'.format(run), 2)
+
+        # One server-side cursor for the stocks, one bases query per chunk
+        # of two.
+        with self.assertNumQueries(4):
+            rows = list(export.iter_stocks_with_bases(self.user, chunk_size=2))
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual([len(row['bases']) for row in rows], [2] * 5)
+
+
+class PrivateFileExportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='export@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+        self.stocks = [
+            create_stock_with_bases(self.user, 'AMD-{}'.format(run), 2)
+            for run in range(3)
+        ]
+
+    def test_stocks_csv_export(self):
+        res = self.client.get(export_file_url('stocks', 'csv'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['ticker'] for row in rows],
+                         ['AMD-0', 'AMD-1', 'AMD-2'])
+        self.assertEqual(list(rows[0]), export.STOCK_FIELDS)
+        self.assertEqual(rows[0]['pct_gain'], '123.4')
+        self.assertEqual(rows[0]['start_date'], '2015-10-20')
+
+    def test_stock_bases_csv_export(self):
+        res = self.client.get(export_file_url('stockbases', 'csv'))
+
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['stock_reference'], str(self.stocks[0].id))
+        self.assertEqual(rows[0]['base_failure'], '')
+        self.assertEqual(rows[0]['bo_vol_ratio'], '2.50')
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_stock_bases_parquet_export(self):
+        res = self.client.get(export_file_url('stockbases', 'parquet'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        table = pyarrow.parquet.read_table(
+            io.BytesIO(b''.join(res.streaming_content)))
+        self.assertEqual(table.column_names,
+                         export.BASE_FIELDS + ['stock_reference'])
+        self.assertEqual(table.num_rows, 6)
+        rows = table.to_pylist()
+        self.assertEqual(rows[0]['bo_date'], datetime.date(2016, 1, 1))
+        self.assertEqual(rows[0]['bo_vol_ratio'], Decimal('2.50'))
+        self.assertEqual(rows[1]['vol_bo'], 1001)
+
+    def test_unknown_export_not_found(self):
+        for dataset, file_format in [('users', 'csv'), ('stocks', 'xlsx')]:
+            res = self.client.get(export_file_url(dataset, file_format))
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,112 @@
+"""
+Parity of the fast list serializers with the DRF serializers.
+"""
+from decimal import Decimal
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import (Stock, StockBase)
+
+from stock.fast_serializers import get_fast_serializer
+from stock.serializers import (
+    StockBaseSerializer,
+    StockDetailSerializer,
+    StockSerializer,
+)
+
+STOCKS_URL = reverse('stock:stock-list')
+STOCK_BASES_URL = reverse('stock:stockbase-list')
+
+cache = caches[settings.STOCK_API_CACHE]
+
+
+class FastSerializerParityTests(TestCase):
+    """The fast serializers render exactly what the DRF serializers do."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='fast@example.com', password='testP@ssw0rd24601')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        gains = [Decimal('123.4'), Decimal('5'), Decimal('-0.1')]
+        for run, gain in enumerate(gains):
+            stock = Stock.objects.create(
+                user=self.user,
+                ticker='AMD-{}'.format(run),
+                start_date=datetime.date(2015, 10, 20),
+                end_date=datetime.date(2017, 1, run + 1),
+                num_bases=run,
+                sector='Electronic Technology',
+                length_run=90 + run,
+                pct_gain=gain,
+                stock_run_notes='notes {}'.format(run),
+            )
+            for count in range(run):
+                stock.bases.add(StockBase.objects.create(
+                    user=self.user, stock_reference=stock,
+                    ticker=stock.ticker, base_count=count,
+                    bo_date=datetime.date(2016, 2, 29),
+                    base_failure='n' if count else None,
+                    vol_bo=10 ** 9 + count, bo_vol_ratio=Decimal('2.5'),
+                    price_percent_range=Decimal('0.05'),
+                    sales_0qtr=Decimal('12345678.9'),
+                ))
+        # a base linked to no stock
+        StockBase.objects.create(user=self.user, ticker='ZZ-1', base_count=1,
+                                 bo_date=datetime.date(2020, 1, 1))
+
+    def assertParity(self, serializer_class, queryset, fields=None):
+        fast = get_fast_serializer(serializer_class, fields)
+        expected = serializer_class(queryset, many=True).data
+        if fields is not None:
+            expected = [{name: item[name] for name in fields}
+                        for item in expected]
+
+        data = fast.serialize(queryset.values('id', *fast.columns))
+
+        self.assertEqual(data, expected)
+        for item, expected_item in zip(data, expected):
+            self.assertEqual(list(item), list(expected_item))
+
+    def test_stock_serializer_parity(self):
+        self.assertParity(StockSerializer, Stock.objects.order_by('-id'))
+
+    def test_stock_detail_serializer_parity(self):
+        self.assertParity(StockDetailSerializer, Stock.objects.order_by('id'))
+
+    def test_stock_base_serializer_parity(self):
+        self.assertParity(StockBaseSerializer,
+                          StockBase.objects.order_by('ticker', 'id'))
+
+    def test_field_selection_parity(self):
+        self.assertParity(StockSerializer, Stock.objects.order_by('-id'),
+                          ['ticker', 'pct_gain', 'bases'])
+        self.assertParity(StockBaseSerializer,
+                          StockBase.objects.order_by('id'),
+                          ['bo_date', 'sales_0qtr'])
+
+    def test_list_endpoints_match_drf(self):
+        """The fast list action returns the same response as DRF."""
+        requests = [
+            (STOCKS_URL, {}),
+            (STOCKS_URL, {'page_size': 2}),
+            (STOCKS_URL, {'fields': 'ticker,bases'}),
+            (STOCK_BASES_URL, {}),
+            (STOCK_BASES_URL, {'page_size': 3, 'exclude': 'ticker'}),
+        ]
+        for url, params in requests:
+            cache.clear()
+            fast = self.client.get(url, params)
+            cache.clear()
+            with override_settings(STOCK_API_FAST_LIST=False):
+                drf = self.client.get(url, params)
+            self.assertEqual(fast.status_code, drf.status_code)
+            self.assertEqual(fast.content, drf.content, (url, params))
@@ -0,0 +1,134 @@
+"""
+Tests for the range filters and ordering of the stock API lists.
+"""
+from decimal import Decimal
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (Stock, StockBase)
+
+STOCKS_URL = reverse('stock:stock-list')
+STOCK_BASES_URL = reverse('stock:stockbase-list')
+
+RUNS = [
+    # ticker, start year, sector, length_run, pct_gain
+    ('AMD-1', 2014, 'Electronic Technology', 120, '350.0'),
+    ('AMD-2', 2016, 'Electronic Technology', 80, '310.5'),
+    ('NVDA-1', 2016, 'Technology Services', 90, '350.0'),
+    ('TSLA-1', 2019, 'Consumer Durables', 60, '700.0'),
+    ('SQ-1', 2017, 'Technology Services', 95, '120.0'),
+]
+
+
+class RangeFilterTests(TestCase):
+    """Filtering and ordering of the stock and stock base lists."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='filters@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+        for ticker, year, sector, length_run, pct_gain in RUNS:
+            stock = Stock.objects.create(
+                user=self.user, ticker=ticker,
+                start_date=datetime.date(year, 3, 1),
+                end_date=datetime.date(year + 1, 3, 1),
+                num_bases=length_run // 30, sector=sector,
+                length_run=length_run, pct_gain=Decimal(pct_gain))
+            StockBase.objects.create(
+                user=self.user, stock_reference=stock, ticker=ticker,
+                base_count=1, bo_date=datetime.date(year, 6, 1),
+                base_length=length_run // 10,
+                bo_vol_ratio=Decimal('1.5') if year > 2016 else None)
+
+    def tickers(self, url, params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.data)
+        return [item['ticker'] for item in res.data]
+
+    def test_range_filters(self):
+        params = {'pct_gain__gt': '300', 'length_run__lt': '100',
+                  'start_date__gte': '2015-01-01'}
+
+        self.assertEqual(self.tickers(STOCKS_URL, params),
+                         ['TSLA-1', 'NVDA-1', 'AMD-2'])
+
+    def test_text_filters(self):
+        self.assertEqual(
+            self.tickers(STOCKS_URL, {'sector': 'Technology Services'}),
+            ['SQ-1', 'NVDA-1'])
+        self.assertEqual(
+            self.tickers(STOCKS_URL, {
+                'sector__in': 'Consumer Durables,Technology Services'}),
+            ['SQ-1', 'TSLA-1', 'NVDA-1'])
+
+    def test_runs_of_a_symbol(self):
+        self.assertEqual(self.tickers(STOCKS_URL, {'symbol': 'AMD'}),
+                         ['AMD-2', 'AMD-1'])
+        params = {'symbol__in': 'AMD,SQ', 'run_number__gte': '2'}
+        self.assertEqual(self.tickers(STOCKS_URL, params), ['AMD-2'])
+
+    def test_stock_base_filters(self):
+        params = {'base_length__gte': '9', 'bo_date__lt': '2018-01-01'}
+
+        self.assertEqual(self.tickers(STOCK_BASES_URL, params),
+                         ['AMD-1', 'NVDA-1', 'SQ-1'])
+
+    def test_invalid_filters(self):
+        for params in [{'pct_gain__gt': 'lots'},
+                       {'start_date__gte': '2015-13-01'},
+                       {'sector__gt': 'A'}, {'length_run__in': '1,2'}]:
+            res = self.client.get(STOCKS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST,
+                             params)
+            self.assertIn(list(params)[0], res.data)
+
+    def test_ordering(self):
+        self.assertEqual(self.tickers(STOCKS_URL, {'ordering': '-pct_gain'}),
+                         ['TSLA-1', 'AMD-1', 'NVDA-1', 'AMD-2', 'SQ-1'])
+        self.assertEqual(
+            self.tickers(STOCK_BASES_URL, {'ordering': '-base_length,ticker'}),
+            ['AMD-1', 'NVDA-1', 'SQ-1', 'AMD-2', 'TSLA-1'])
+
+    def test_ordering_outside_whitelist_is_ignored(self):
+        self.assertEqual(
+            self.tickers(STOCKS_URL, {'ordering': 'stock_run_notes'}),
+            self.tickers(STOCKS_URL, {}))
+
+    def test_ordered_pages(self):
+        """Cursor pages follow the ordering, ties included."""
+        tickers = []
+        res = self.client.get(STOCKS_URL,
+                              {'ordering': 'pct_gain', 'page_size': 2})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            tickers += [item['ticker'] for item in res.data['results']]
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(tickers,
+                         ['SQ-1', 'AMD-2', 'AMD-1', 'NVDA-1', 'TSLA-1'])
+
+    def test_pages_can_not_be_ordered_by_nullable_field(self):
+        res = self.client.get(STOCK_BASES_URL,
+                              {'ordering': 'bo_vol_ratio', 'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fast_list_matches_drf(self):
+        params = {'ordering': '-length_run', 'pct_gain__gte': '300',
+                  'page_size': 2}
+        fast = self.client.get(STOCKS_URL, params)
+        with override_settings(STOCK_API_FAST_LIST=False,
+                               STOCK_API_CACHE_TIMEOUT=0):
+            drf = self.client.get(STOCKS_URL, {**params, 'drf': 1})
+
+        self.assertEqual(fast.data['results'], drf.data['results'])
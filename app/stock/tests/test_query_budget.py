@@ -0,0 +1,76 @@
+"""
+Query budgets of the stock API endpoints.
+
+Every endpoint must issue the same small number of queries whatever the
+number of runs and bases of the user.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.tests.utils import QueryBudgetMixin, create_stock_with_bases
+
+STOCKS_URL = reverse('stock:stock-list')
+STOCK_BASES_URL = reverse('stock:stockbase-list')
+
+# Maximum number of queries per endpoint, authentication excluded. Reads
+# include one query for the data version behind the ETag.
+QUERY_BUDGETS = {
+    'stock-list': 3,
+    'stock-detail': 3,
+    'stockbase-list': 2,
+}
+
+
+class StockQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """List and detail endpoints stay within their query budget."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='budget@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+
+    def test_stock_list_budget(self):
+        for run in range(25):
+            create_stock_with_bases(self.user, 'AMD-{}'.format(run), 4)
+
+        res = self.assertQueryBudget(QUERY_BUDGETS['stock-list'], STOCKS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 25)
+        self.assertEqual(len(res.data[0]['bases']), 4)
+
+    def test_stock_list_filtered_by_bases_budget(self):
+        stock = create_stock_with_bases(self.user, 'AMD-1', 3)
+        create_stock_with_bases(self.user, 'NVDA-1', 3)
+        base_ids = ','.join(str(base.id) for base in stock.bases.all())
+
+        res = self.assertQueryBudget(QUERY_BUDGETS['stock-list'], STOCKS_URL,
+                                     data={'bases': base_ids})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['ticker'] for item in res.data], ['AMD-1'])
+
+    def test_stock_detail_budget(self):
+        stock = create_stock_with_bases(self.user, 'AMD-1', 20)
+
+        res = self.assertQueryBudget(
+            QUERY_BUDGETS['stock-detail'],
+            reverse('stock:stock-detail', args=[stock.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['bases']), 20)
+
+    def test_stock_base_list_budget(self):
+        for run in range(10):
+            create_stock_with_bases(self.user, 'AMD-{}'.format(run), 5)
+
+        res = self.assertQueryBudget(QUERY_BUDGETS['stockbase-list'],
+                                     STOCK_BASES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 50)
@@ -190,4 +190,84 @@ class PrivateStockBaseApiTests(TestCase):
         stock_base.refresh_from_db()
         self.assertEqual(stock_base.ticker, payload['ticker'])
 
+    def test_update_to_identity_of_other_base_rejected(self):
+        """Two bases can not share (user, ticker, base_count, bo_date)."""
+        bases = [
+            StockBase.objects.create(user=self.user, ticker='NVDA-1',
+                                     base_count=count,
+                                     bo_date=datetime.date(2015, 9, 28))
+            for count in [1, 2]
+        ]
+
+        res = self.client.patch(detail_url(bases[1].id), {'base_count': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', res.data)
+        bases[1].refresh_from_db()
+        self.assertEqual(bases[1].base_count, 2)
+
+    def test_update_to_base_count_of_imported_base_rejected(self):
+        stock = create_stock(self.user)
+        bases = [
+            StockBase.objects.create(
+                user=self.user, stock_reference=stock, ticker='NVDA-1',
+                base_count=count, bo_date=datetime.date(2015, 9, 28 - count),
+                source_hash='imported-{}'.format(count))
+            for count in [1, 2]
+        ]
+
+        res = self.client.patch(detail_url(bases[1].id), {'base_count': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('base_count', res.data)
+
+    def test_update_keeping_own_identity(self):
+        stock_base = StockBase.objects.create(
+            user=self.user, ticker='NVDA-1', base_count=1,
+            bo_date=datetime.date(2015, 9, 28))
+        other_user = create_user(email='other@example.com')
+        StockBase.objects.create(user=other_user, ticker='NVDA-1',
+                                 base_count=2,
+                                 bo_date=datetime.date(2015, 9, 28))
+
+        res = self.client.patch(detail_url(stock_base.id),
+                                {'base_count': 2, 'ticker': 'NVDA-1'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_stock_bases_cursor_pagination(self):
+        """Paging through the bases returns every base once, by ticker."""
+        stock = create_stock(self.user)
+        for ticker in ['TSLA-1', 'AMD-1', 'NVDA-1']:
+            for count in range(2):
+                StockBase.objects.create(user=self.user,
+                                         stock_reference=stock,
+                                         ticker=ticker,
+                                         base_count=count,
+                                         bo_date=datetime.date(2020, 7, 28))
+
+        seen = []
+        res = self.client.get(STOCK_BASE_URL, {'page_size': 4})
+        self.assertEqual(len(res.data['results']), 4)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen += [(base['ticker'], base['id'])
+                     for base in res.data['results']]
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        expected = (StockBase.objects.filter(user=self.user)
+                    .order_by('ticker', 'id'))
+        self.assertEqual(seen, [(base.ticker, base.id) for base in expected])
+
+    def test_stock_bases_sparse_fieldset(self):
+        stock = create_stock(self.user)
+        StockBase.objects.create(user=self.user, stock_reference=stock,
+                                 ticker='AMD-1', base_count=1, vol_bo=1000,
+                                 bo_date=datetime.date(2020, 7, 28))
 
+        res = self.client.get(STOCK_BASE_URL, {'fields': 'bo_date,vol_bo'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'bo_date': '2020-07-28', 'vol_bo': 1000}])
@@ -3,13 +3,15 @@ import datetime
 import pytz
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import (Stock, StockBase)
+from core.models import (DataVersion, Stock, StockBase)
 
 
 from stock.serializers import (
@@ -99,6 +101,70 @@ class PrivateStockAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_stocks_cursor_pagination(self):
+        """Paging through the stocks returns every stock once, newest first."""
+        stocks = [create_stock(user=self.user, ticker='AMD-{}'.format(run))
+                  for run in range(5)]
+
+        res = self.client.get(STOCKS_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data['results']],
+                         [stocks[4].id, stocks[3].id])
+        self.assertIsNone(res.data['previous'])
+
+        ids = []
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [stock.id for stock in reversed(stocks[:3])])
+
+    def test_page_size_is_capped(self):
+        create_stock(user=self.user)
+        create_stock(user=self.user)
+
+        with self.settings(STOCK_API_MAX_PAGE_SIZE=1):
+            res = self.client.get(STOCKS_URL, {'page_size': 50})
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_sparse_fieldset(self):
+        """Only the requested fields are serialized and fetched."""
+        stock = create_stock(user=self.user)
+        stock.bases.add(StockBase.objects.create(
+            user=self.user, ticker='AMD-1', base_count=1,
+            bo_date=datetime.date(2016, 1, 4)))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                STOCKS_URL, {'fields': 'ticker,pct_gain,length_run'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(res.data[0]),
+                         ['ticker', 'length_run', 'pct_gain'])
+        stock_queries = [query['sql'] for query in queries
+                         if 'core_stock' in query['sql']]
+        self.assertEqual(len(stock_queries), 1)
+        self.assertNotIn('sector', stock_queries[0])
+
+    def test_exclude_fields(self):
+        stock = create_stock(user=self.user)
+
+        res = self.client.get(detail_url(stock.id),
+                              {'exclude': 'bases,stock_run_notes'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('bases', res.data)
+        self.assertNotIn('stock_run_notes', res.data)
+        self.assertEqual(res.data['ticker'], stock.ticker)
+
+    def test_unknown_field_rejected(self):
+        create_stock(user=self.user)
+
+        res = self.client.get(STOCKS_URL, {'fields': 'ticker,password'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_stock_detail(self):
         stock = create_stock(user=self.user)
         url = detail_url(stock.id)
@@ -312,6 +378,116 @@ class PrivateStockAPITests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_stock_with_bases_constant_queries(self):
+        """The number of queries does not grow with the nested bases."""
+        def post_stock(ticker, num_bases):
+            payload = {
+                "ticker": ticker,
+                "start_date": "2016-10-31",
+                "end_date": "2018-10-8",
+                "sector": "Technology Services",
+                "num_bases": num_bases,
+                "length_run": 101,
+                "pct_gain": Decimal("738.5"),
+                "bases": [{
+                    'ticker': ticker,
+                    'base_count': count,
+                    'bo_date': '2017-2-21',
+                } for count in range(num_bases)],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(STOCKS_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        for ticker in ['SQ-1', 'SQ-2']:
+            StockBase.objects.create(user=self.user, ticker=ticker,
+                                     base_count=0,
+                                     bo_date=datetime.date(2017, 2, 21))
+
+        self.assertEqual(post_stock('SQ-1', 2), post_stock('SQ-2', 20))
+        self.assertEqual(StockBase.objects.filter(ticker='SQ-1').count(), 2)
+        self.assertEqual(Stock.objects.get(ticker='SQ-2').bases.count(), 20)
+
+    def test_unchanged_full_update_writes_nothing(self):
+        """A PUT which changes nothing only reads."""
+        stock = create_stock(self.user, ticker='SQ-1',
+                             pct_gain=Decimal('123.4'))
+        payload = {
+            "ticker": "SQ-1",
+            "start_date": "2015-10-20",
+            "end_date": "2017-10-20",
+            "sector": "Electronic Technology",
+            "num_bases": 4,
+            "length_run": 90,
+            "pct_gain": "123.4",
+            "stock_run_notes": "",
+            "bases": [{
+                'ticker': 'SQ-1',
+                'base_count': count,
+                'bo_date': '2016-2-21',
+            } for count in range(5)],
+        }
+        url = detail_url(stock.id)
+        res = self.client.put(url, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.put(url, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+        self.assertEqual(stock.bases.count(), 5)
+
+    def test_update_changes_values_of_existing_base(self):
+        """Fields of a nested base other than its identity are written."""
+        stock = create_stock(self.user, ticker='SQ-1')
+        base = StockBase.objects.create(user=self.user, ticker='SQ-1',
+                                        base_count=1,
+                                        bo_date=datetime.date(2016, 2, 21),
+                                        vol_bo=100, base_length=7)
+        stock.bases.add(base)
+        url = detail_url(stock.id)
+        version = DataVersion.objects.current(self.user)[0]
+
+        res = self.client.patch(url, {'bases': [
+            {'ticker': 'SQ-1', 'base_count': 1, 'bo_date': '2016-02-21',
+             'vol_bo': 999},
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).data['bases'][0]['vol_bo'], 999)
+        base.refresh_from_db()
+        self.assertEqual((base.vol_bo, base.base_length), (999, 7))
+        self.assertEqual(StockBase.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(DataVersion.objects.current(self.user)[0],
+                         version + 1)
+
+    def test_update_writes_only_changed_links(self):
+        """Only added and removed bases touch the stock links."""
+        stock = create_stock(self.user, ticker='SQ-1')
+        bases = [{'ticker': 'SQ-1', 'base_count': count,
+                  'bo_date': '2016-2-21'} for count in range(3)]
+        url = detail_url(stock.id)
+        self.client.patch(url, {'bases': bases}, format='json')
+        kept = list(stock.bases.filter(base_count__lt=2))
+
+        bases[2] = {'ticker': 'SQ-1', 'base_count': 3, 'bo_date': '2016-2-21'}
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(url, {'bases': bases}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(stock.bases.values_list('base_count', flat=True)),
+            [0, 1, 3])
+        for base in kept:
+            self.assertIn(base, stock.bases.all())
+        link_writes = [query['sql'] for query in queries
+                       if 'core_stock_bases' in query['sql']
+                       and query['sql'].startswith(('INSERT', 'DELETE'))]
+        self.assertEqual(len(link_writes), 2)
 
     def test_create_base_on_stock_run_update(self):
         """Tests creating a stock base when updating a stock run
@@ -431,9 +607,33 @@ class PrivateStockAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
-
-
-
-
-
-
+    def test_filter_by_all_stock_bases(self):
+        """bases_mode=all keeps the runs linked to every listed base."""
+        bases = [
+            StockBase.objects.create(user=self.user, ticker='NVDA-1',
+                                     base_count=count,
+                                     bo_date=datetime.date(2020, 7, 28))
+            for count in range(3)
+        ]
+        both = create_stock(user=self.user, ticker='NVDA-1')
+        both.bases.add(*bases)
+        one = create_stock(user=self.user, ticker='NVDA-2')
+        one.bases.add(bases[0])
+        params = {'bases': f'{bases[0].id},{bases[1].id}'}
+
+        with CaptureQueriesContext(connection) as queries:
+            any_res = self.client.get(STOCKS_URL, params)
+        all_res = self.client.get(STOCKS_URL, {**params, 'bases_mode': 'all'})
+
+        self.assertEqual([item['ticker'] for item in any_res.data],
+                         ['NVDA-2', 'NVDA-1'])
+        self.assertEqual([item['ticker'] for item in all_res.data], ['NVDA-1'])
+        self.assertFalse(any('DISTINCT' in query['sql'] for query in queries))
+
+    def test_invalid_stock_base_filter(self):
+        """Bad ids or modes are a 400, not a server error."""
+        for params in [{'bases': '1,abc'},
+                       {'bases': '1', 'bases_mode': 'some'}]:
+            res = self.client.get(STOCKS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
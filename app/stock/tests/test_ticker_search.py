@@ -0,0 +1,124 @@
+"""
+Tests for the ticker prefix search.
+"""
+from decimal import Decimal
+from unittest.mock import patch
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (DataVersion, Stock, StockBase)
+from stock import ticker_index
+
+TICKERS_URL = reverse('stock:tickers')
+
+
+def create_stock(user, ticker):
+    return Stock.objects.create(
+        user=user, ticker=ticker, start_date=datetime.date(2016, 10, 31),
+        end_date=datetime.date(2018, 10, 8), num_bases=0,
+        sector='Technology Services', length_run=101,
+        pct_gain=Decimal('738.5'))
+
+
+class TickerSearchTests(TestCase):
+    """Prefix search over the tickers of a user."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='tickers@example.com', password='testP@ssw0rd24601')
+        self.client.force_authenticate(self.user)
+        for ticker in ['AMD-1', 'AMD-2', 'AAPL-1', 'NVDA-1']:
+            create_stock(self.user, ticker)
+        StockBase.objects.create(user=self.user, ticker='AMAT-1', base_count=1,
+                                 bo_date=datetime.date(2020, 1, 1))
+        StockBase.objects.create(user=self.user, ticker='amd-2', base_count=1,
+                                 bo_date=datetime.date(2020, 1, 1))
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='pass12345')
+        create_stock(other, 'AMZN-1')
+
+        ticker_index.indexes.clear()
+        # rebuild inline, the test transaction is invisible to other threads
+        schedule = patch.object(ticker_index.indexes, 'schedule',
+                                side_effect=self.rebuild)
+        self.schedule = schedule.start()
+        self.addCleanup(schedule.stop)
+
+    def rebuild(self, user_id):
+        ticker_index.indexes.put(user_id, ticker_index.indexes.build(user_id))
+
+    def search(self, **params):
+        res = self.client.get(TICKERS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(item['ticker'], item['runs']) for item in res.data]
+
+    def test_cold_search_reads_the_database(self):
+        expected = [('AMAT-1', 0), ('AMD-1', 2), ('AMD-2', 2)]
+
+        self.assertEqual(self.search(prefix='am'), expected)
+        self.schedule.assert_called_once_with(self.user.pk)
+
+    def test_warm_search_reads_no_stock_table(self):
+        self.search(prefix='am')
+
+        with CaptureQueriesContext(connection) as queries:
+            results = self.search(prefix='AM', limit=2)
+
+        self.assertEqual(results, [('AMAT-1', 0), ('AMD-1', 2)])
+        self.assertEqual(self.schedule.call_count, 1)
+        self.assertFalse(any('core_stock' in query['sql']
+                             for query in queries))
+
+    def test_index_and_fallback_agree(self):
+        prefixes = ['', 'a', 'amd-', 'n', 'x']
+        cold = [self.search(prefix=prefix, limit=3) for prefix in prefixes]
+        warm = [self.search(prefix=prefix, limit=3) for prefix in prefixes]
+
+        self.assertEqual(cold, warm)
+        self.assertEqual(warm[0], [('AAPL-1', 1), ('AMAT-1', 0), ('AMD-1', 2)])
+        self.assertEqual(warm[4], [])
+
+    def test_runs_counted_per_symbol(self):
+        StockBase.objects.create(user=self.user, ticker='NVDA-2', base_count=1,
+                                 bo_date=datetime.date(2020, 1, 1))
+
+        self.assertEqual(self.search(prefix='nvda-2'), [('NVDA-2', 1)])
+        self.assertEqual(self.search(prefix='nvda'),
+                         [('NVDA-1', 1), ('NVDA-2', 1)])
+
+    def test_writes_make_the_index_stale(self):
+        self.search(prefix='am')
+        create_stock(self.user, 'AMBA-1')
+        DataVersion.objects.bump(self.user)
+
+        self.assertEqual(self.search(prefix='amb'), [('AMBA-1', 1)])
+        self.assertEqual(self.schedule.call_count, 2)
+
+    def test_invalid_limit(self):
+        for limit in ['0', 'ten', '1000']:
+            res = self.client.get(TICKERS_URL, {'prefix': 'a', 'limit': limit})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TickerIndexesTests(TestCase):
+
+    def test_least_recently_used_user_dropped(self):
+        indexes = ticker_index.TickerIndexes(max_users=2)
+        for user_id in [1, 2]:
+            indexes.put(user_id, ticker_index.TickerIndex(1, {'AMD-1': 1}))
+        indexes.get(1, 1)
+        indexes.put(3, ticker_index.TickerIndex(1, {}))
+
+        self.assertIsNotNone(indexes.get(1, 1))
+        self.assertIsNone(indexes.get(2, 1))
+        self.assertIsNone(indexes.get(1, 2))
@@ -0,0 +1,163 @@
+"""
+Ticker prefix search of the stock API.
+
+The distinct tickers of a user's runs and bases, with the number of runs
+of their symbol, are kept in process as a sorted list searched with bisect. An
+index belongs to the data version of the user it was read at. Once the
+user writes, the next search finds it stale, answers with an indexed
+LIKE 'prefix%' query instead and has that user's index, and only that
+one, rebuilt in the background.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from django.db.models.functions import Collate, Upper
+
+from core.models import (DataVersion, Stock, StockBase, split_ticker)
+
+
+def _with_keys(queryset, prefix):
+    """Annotate UPPER(ticker) and keep the keys starting with a prefix.
+
+    The LIKE is served by the (user_id, UPPER(ticker) text_pattern_ops)
+    indexes, ordering in the C collation matches Python's sort.
+    """
+    queryset = queryset.annotate(key=Upper('ticker'))
+    if prefix:
+        queryset = queryset.filter(key__startswith=prefix)
+    return queryset.order_by(Collate('key', 'C'))
+
+
+def read_tickers(user, prefix='', limit=None):
+    """Read tickers of a user's runs and bases, with their symbol run counts.
+
+    A ticker like AMD-2 names one run, the count is of the runs of AMD.
+
+    Args:
+        user (User): owner of the stock data
+        prefix (str): upper cased ticker prefix, '' for all tickers
+        limit (int): first tickers wanted, None for all
+
+    Returns:
+        dict: {TICKER: number of runs of its symbol}, 0 for symbols without
+            runs
+    """
+    runs = (_with_keys(Stock.objects.filter(user=user), prefix)
+            .values_list('key', flat=True).distinct())
+    bases = (_with_keys(StockBase.objects.filter(user=user), prefix)
+             .values_list('key', flat=True).distinct())
+    if limit is not None:
+        runs, bases = runs[:limit], bases[:limit]
+    symbols = {key: split_ticker(key)[0] for key in set(runs) | set(bases)}
+
+    stocks = Stock.objects.filter(user=user)
+    if prefix or limit is not None:
+        stocks = stocks.filter(symbol__in=set(symbols.values()))
+    run_counts = dict(stocks.order_by().values('symbol')
+                      .annotate(runs=Count('id'))
+                      .values_list('symbol', 'runs'))
+    return {key: run_counts.get(symbol, 0) for key, symbol in symbols.items()}
+
+
+class TickerIndex:
+    """Sorted tickers of one user at one data version."""
+
+    def __init__(self, version, counts):
+        self.version = version
+        self.runs = counts
+        self.tickers = sorted(counts)
+
+    def search(self, prefix, limit):
+        """First tickers starting with a prefix, as (ticker, runs) pairs."""
+        start = bisect.bisect_left(self.tickers, prefix)
+        return [(ticker, self.runs[ticker])
+                for ticker in self.tickers[start:start + limit]
+                if ticker.startswith(prefix)]
+
+
+class TickerIndexes:
+    """Ticker indexes of this process, least recently used users dropped
+    first."""
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self.indexes = OrderedDict()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='ticker-index')
+
+    def get(self, user_id, version):
+        """Index of a user if it is at this version, else None."""
+        with self.lock:
+            index = self.indexes.get(user_id)
+            if index is None or index.version != version:
+                return None
+            self.indexes.move_to_end(user_id)
+            return index
+
+    def put(self, user_id, index):
+        with self.lock:
+            self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+
+    def build(self, user_id):
+        """Read the index of a user.
+
+        The version is read first, a write landing in between leaves the
+        index newer than its version and it is simply rebuilt once more.
+        """
+        version, _ = DataVersion.objects.current(user_id)
+        return TickerIndex(version, read_tickers(user_id))
+
+    def schedule(self, user_id):
+        """Rebuild the index of a user in the background, once at a time."""
+        with self.lock:
+            if user_id in self.pending:
+                return
+            self.pending.add(user_id)
+        self.executor.submit(self._rebuild, user_id)
+
+    def _rebuild(self, user_id):
+        try:
+            self.put(user_id, self.build(user_id))
+        finally:
+            with self.lock:
+                self.pending.discard(user_id)
+            # the worker thread has its own connections
+            connections.close_all()
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+
+indexes = TickerIndexes(settings.STOCK_API_TICKER_INDEX_USERS)
+
+
+def search(user, prefix, limit):
+    """Tickers of a user starting with a prefix, any case.
+
+    Args:
+        user (User): owner of the stock data
+        prefix (str): start of the ticker
+        limit (int): maximum number of tickers
+
+    Returns:
+        list: (TICKER, number of runs of its symbol) pairs in ticker order
+    """
+    prefix = prefix.upper()
+    version, _ = DataVersion.objects.current(user)
+    index = indexes.get(user.pk, version)
+    if index is not None:
+        return index.search(prefix, limit)
+
+    indexes.schedule(user.pk)
+    return sorted(read_tickers(user, prefix, limit).items())[:limit]
@@ -15,6 +15,10 @@ router.register('stockbases', views.StockBaseViewSet)
 app_name = 'stock'
 
 urlpatterns = [
+    path('tickers/', views.TickerSearchView.as_view(), name='tickers'),
+    path('export/', views.StockExportView.as_view(), name='export'),
+    path('export/<str:dataset>.<str:file_format>',
+         views.StockFileExportView.as_view(), name='export-file'),
     path('', include(router.urls)),
 ]
 
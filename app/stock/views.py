@@ -1,4 +1,7 @@
 import datetime
+import hashlib
+import pickle
+import tempfile
 import pytz
 
 from drf_spectacular.utils import (
@@ -13,16 +16,157 @@ from rest_framework import (
     mixins,
     status,
 )
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Exists, OuterRef
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
+from core.authentication import CachedTokenAuthentication
 from core.models import (
+    DataVersion,
     Stock,
     StockBase
 )
-from stock import serializers
+from stock import bulk, export, fast_serializers, serializers, ticker_index
+from stock.filters import RangeFilter, StableOrderingFilter
+from stock.pagination import (
+    StockCursorPagination,
+    StockBaseCursorPagination,
+)
+
+FIELD_SELECTION_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated list of fields to return',
+    ),
+    OpenApiParameter(
+        'exclude',
+        OpenApiTypes.STR,
+        description='Comma separated list of fields to leave out',
+    ),
+]
+
+BASES_MODES = ['any', 'all']
+
+TICKER_SEARCH_LIMIT = 10
+TICKER_SEARCH_MAX_LIMIT = 100
+
+
+class DataVersionMixin:
+    """Conditional GET and response caching backed by the user's data version.
+
+    list, and retrieve where a viewset wraps it, carry an ETag and
+    Last-Modified derived from the DataVersion of the user. A matching
+    If-None-Match is answered with 304 without reading the stock tables,
+    other responses are served from the STOCK_API_CACHE cache under the
+    same key. Every write through the viewset bumps the version, which
+    invalidates both. Responses larger than STOCK_API_CACHE_MAX_ITEM_BYTES,
+    like a whole unpaginated list, are not cached.
+    """
+
+    def get_etag(self, request, version):
+        """ETag of a version, distinct per URL and Accept header."""
+        key = '{} {}'.format(request.build_absolute_uri(),
+                             request.META.get('HTTP_ACCEPT', ''))
+        digest = hashlib.blake2b(key.encode(), digest_size=8)
+        return '"{}-{}-{}"'.format(
+            request.user.pk, version, digest.hexdigest())
+
+    def cached(self, handler, request, etag, *args, **kwargs):
+        """Response data from the cache, or from the handler and then cached.
+
+        The data is pickled here, once, so its size is known before it is
+        stored.
+        """
+        cache = caches[settings.STOCK_API_CACHE]
+        key = 'stock-api:{}'.format(etag.strip('"'))
+        pickled = cache.get(key)
+        if pickled is not None:
+            return Response(pickle.loads(pickled))
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            pickled = pickle.dumps(response.data, pickle.HIGHEST_PROTOCOL)
+            if len(pickled) <= settings.STOCK_API_CACHE_MAX_ITEM_BYTES:
+                cache.set(key, pickled, settings.STOCK_API_CACHE_TIMEOUT)
+        return response
+
+    def conditional(self, handler, request, *args, **kwargs):
+        version, updated_at = DataVersion.objects.current(request.user)
+        etag = self.get_etag(request, version)
+        last_modified = int(updated_at.timestamp()) if updated_at else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.cached(handler, request, etag, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def bump_data_version(self, serializer=None):
+        """Bump the user's data version unless the serializer wrote nothing."""
+        if getattr(serializer, 'changed', True):
+            DataVersion.objects.bump(self.request.user)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.bump_data_version(serializer)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.bump_data_version(serializer)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.bump_data_version()
+
+
+class FastListMixin:
+    """Render the list action from .values() rows instead of model instances.
+
+    Same JSON as the serializer class, see stock/fast_serializers.py.
+    Switched off with the STOCK_API_FAST_LIST setting.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.STOCK_API_FAST_LIST:
+            return super().list(request, *args, **kwargs)
+
+        serializer_class = self.get_serializer_class()
+        fields = serializers.selected_fields(
+            request, serializer_class.Meta.fields)
+        fast = fast_serializers.get_fast_serializer(serializer_class, fields)
+
+        # id for the nested bases, ordering fields for the cursor position
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = ()
+        if self.paginator:
+            ordering = self.paginator.get_ordering(request, queryset, self)
+        ordering = [ordering] if isinstance(ordering, str) else list(ordering)
+        columns = dict.fromkeys(
+            ['id'] + [field.lstrip('-') for field in ordering] + fast.columns)
+        rows = queryset.prefetch_related(None).values(*columns)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.serialize(page))
+        return Response(fast.serialize(rows))
 
 
 @extend_schema_view(
@@ -33,10 +177,18 @@ from stock import serializers
                 OpenApiTypes.STR,
                 description='Comma separated list of stock base IDs to filter',
             ),
-        ]
-    )
+            OpenApiParameter(
+                'bases_mode',
+                OpenApiTypes.STR,
+                enum=BASES_MODES,
+                description='Match runs with any (default) or all of the '
+                            'listed bases',
+            ),
+        ] + FIELD_SELECTION_PARAMETERS
+    ),
+    retrieve=extend_schema(parameters=FIELD_SELECTION_PARAMETERS),
 )
-class StockViewSet(viewsets.ModelViewSet):
+class StockViewSet(DataVersionMixin, FastListMixin, viewsets.ModelViewSet):
     """Manage the stock (runs) API
 
     Args:
@@ -47,11 +199,51 @@ class StockViewSet(viewsets.ModelViewSet):
     """
     serializer_class = serializers.StockDetailSerializer
     queryset = Stock.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = StockCursorPagination
+    filter_backends = [RangeFilter, StableOrderingFilter]
+    range_filter_fields = [
+        'symbol', 'run_number', 'pct_gain', 'length_run', 'num_bases',
+        'start_date', 'end_date', 'sector',
+    ]
+    ordering_fields = ['id', 'ticker'] + range_filter_fields
+    ordering = ['-id']
 
     def _params_to_int(self, qs):
-        return [int(str_id) for str_id in qs.split(',')]
+        """Comma separated ids as ints, a 400 for anything else."""
+        str_ids = [str_id.strip() for str_id in qs.split(',')
+                   if str_id.strip()]
+        invalid = [str_id for str_id in str_ids if not str_id.isdigit()]
+        if invalid:
+            raise ValidationError({
+                'bases': 'Invalid stock base ids: {}'.format(
+                    ', '.join(invalid)),
+            })
+        return sorted({int(str_id) for str_id in str_ids})
+
+    def _filter_bases(self, queryset, stock_bases):
+        """Stocks linked to any, or all, of some bases.
+
+        Written as a correlated EXISTS on the link table, so a stock is
+        matched once whatever the number of bases and no DISTINCT is
+        needed. With bases_mode=all the link count must reach the number
+        of bases, the links being unique per stock and base.
+        """
+        mode = self.request.query_params.get('bases_mode', 'any')
+        if mode not in BASES_MODES:
+            raise ValidationError({
+                'bases_mode': 'Expected one of: {}'.format(
+                    ', '.join(BASES_MODES)),
+            })
+        base_ids = self._params_to_int(stock_bases)
+        links = Stock.bases.through.objects.filter(
+            stock_id=OuterRef('pk'), stockbase_id__in=base_ids)
+        if mode == 'all':
+            links = (links.values('stock_id')
+                     .annotate(matched=Count('stockbase_id'))
+                     .filter(matched=len(base_ids)))
+        return queryset.filter(Exists(links))
 
     def get_queryset(self):
         """Stocks for authenticated user
@@ -60,14 +252,20 @@ class StockViewSet(viewsets.ModelViewSet):
             _type_: _description_
         """
         stock_bases = self.request.query_params.get('bases')
+        fields = serializers.selected_fields(
+            self.request, self.get_serializer_class().Meta.fields)
         queryset = self.queryset
+        if fields is None or 'bases' in fields:
+            queryset = queryset.prefetch_related('bases')
+        if fields is not None:
+            queryset = queryset.only(
+                'id', *[field for field in fields if field != 'bases'])
         if stock_bases:
-            base_ids = self._params_to_int(stock_bases)
-            queryset = queryset.filter(bases__id__in=base_ids)
+            queryset = self._filter_bases(queryset, stock_bases)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by('-id')
 
     def get_serializer_class(self):
         """If using list endpoint, use the basic serializer.
@@ -80,6 +278,9 @@ class StockViewSet(viewsets.ModelViewSet):
             return serializers.StockSerializer #return reference to class, not an instantiated object , IE no ()
         return self.serializer_class
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Create a new Stock run object.
         Determine if going to use in final project.
@@ -88,11 +289,34 @@ class StockViewSet(viewsets.ModelViewSet):
             serializer (_type_): _description_
         """
         serializer.save(user=self.request.user)
+        self.bump_data_version(serializer)
+
+    @extend_schema(
+        request=serializers.StockDetailSerializer(many=True),
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Create and update many stock runs, bases nested, in one request.
 
-class StockBaseViewSet(mixins.DestroyModelMixin,
-                      mixins.UpdateModelMixin,
-                      mixins.ListModelMixin,
-                      viewsets.GenericViewSet):
+        Items with an id replace that run, the others are created. Valid
+        items are written in one transaction, invalid ones are left out,
+        and the response has one result per item in request order.
+        """
+        items = bulk.validate_items(
+            request.data, request.user, self.get_serializer_context())
+        if bulk.save_items(items, request.user):
+            self.bump_data_version()
+        return Response({'results': [item.result() for item in items]})
+
+
+@extend_schema_view(list=extend_schema(parameters=FIELD_SELECTION_PARAMETERS))
+class StockBaseViewSet(DataVersionMixin,
+                       FastListMixin,
+                       mixins.DestroyModelMixin,
+                       mixins.UpdateModelMixin,
+                       mixins.ListModelMixin,
+                       viewsets.GenericViewSet):
     """Manage stock bases
 
     Args:
@@ -101,9 +325,106 @@ class StockBaseViewSet(mixins.DestroyModelMixin,
     """
     serializer_class = serializers.StockBaseSerializer
     queryset = StockBase.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = StockBaseCursorPagination
+    filter_backends = [RangeFilter, StableOrderingFilter]
+    range_filter_fields = [
+        'base_count', 'bo_date', 'bo_vol_ratio', 'base_length', 'base_failure',
+    ]
+    ordering_fields = ['id', 'ticker'] + range_filter_fields
+    ordering = ['ticker', 'id']
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user).order_by('ticker') #might break since this is a fk
+        queryset = self.queryset
+        fields = serializers.selected_fields(
+            self.request, self.serializer_class.Meta.fields)
+        if fields is not None:
+            # ticker is the default cursor position of the paginated list
+            queryset = queryset.only('id', 'ticker', *fields)
+        # might break since this is a fk
+        return queryset.filter(user=self.request.user).order_by('ticker', 'id')
+
+
+class TickerSearchView(APIView):
+    """Typeahead of the user's tickers, see stock/ticker_index.py."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('prefix', OpenApiTypes.STR,
+                             description='Start of the ticker, any case'),
+            OpenApiParameter('limit', OpenApiTypes.INT,
+                             description='Maximum number of tickers'),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request):
+        prefix = request.query_params.get('prefix', '').strip()
+        limit = request.query_params.get('limit', str(TICKER_SEARCH_LIMIT))
+        max_limit = TICKER_SEARCH_MAX_LIMIT
+        if not limit.isdigit() or not 0 < int(limit) <= max_limit:
+            raise ValidationError({
+                'limit': 'Expected a number from 1 to {}.'.format(max_limit),
+            })
+
+        tickers = ticker_index.search(request.user, prefix, int(limit))
+        return Response([{'ticker': ticker, 'runs': runs}
+                         for ticker, runs in tickers])
+
+
+class StockExportView(APIView):
+    """Stream every stock run of the user, bases nested, as NDJSON.
+
+    One JSON object per line, read from a server-side cursor in chunks so
+    the export never sits in memory as a whole.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses={(200, 'application/x-ndjson'): OpenApiTypes.STR})
+    def get(self, request):
+        rows = export.iter_stocks_with_bases(request.user)
+        response = StreamingHttpResponse(
+            export.iter_ndjson(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            'attachment; filename="stocks.ndjson"')
+        return response
+
+
+class StockFileExportView(APIView):
+    """Download the user's stocks or stock bases as CSV or Parquet.
+
+    Rows are built from values_list chunks, not serializers. CSV is
+    streamed, Parquet is written to a temporary file one row group per
+    chunk first since its footer comes last.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses={
+        (200, 'text/csv'): OpenApiTypes.BINARY,
+        (200, 'application/vnd.apache.parquet'): OpenApiTypes.BINARY,
+    })
+    def get(self, request, dataset, file_format):
+        if dataset not in export.FILE_EXPORTS:
+            raise NotFound('Unknown export {}.'.format(dataset))
+        model, fields = export.FILE_EXPORTS[dataset]
+        chunks = export.iter_value_chunks(
+            model.objects.filter(user=request.user), fields)
+        file_name = '{}.{}'.format(dataset, file_format)
 
+        if file_format == 'csv':
+            response = StreamingHttpResponse(
+                export.iter_csv(fields, chunks), content_type='text/csv')
+            response['Content-Disposition'] = (
+                'attachment; filename="{}"'.format(file_name))
+            return response
+        if file_format == 'parquet':
+            target = tempfile.TemporaryFile()
+            export.write_parquet(model, fields, chunks, target)
+            target.seek(0)
+            return FileResponse(target, as_attachment=True, filename=file_name,
+                                content_type='application/vnd.apache.parquet')
+        raise NotFound('Unknown export format {}.'.format(file_format))
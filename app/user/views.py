@@ -1,10 +1,12 @@
 """API Views
 
 """
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication
+
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -36,7 +38,7 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         generics (_type_): _description_
     """
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):